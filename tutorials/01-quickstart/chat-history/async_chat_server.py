@@ -0,0 +1,271 @@
+import asyncio
+import json
+import os
+import re
+import time
+from pathlib import Path
+from groq import APIError
+from client_factory import connection_stats, get_async_client, warm_up_async_client
+from stream_metrics import StreamMetrics, create_instrumented_async
+
+HISTORY_DIR = Path('sessions')
+MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"
+SYSTEM_PROMPT = {"role": "system", "content": "You are a helpful assistant."}
+HOST = os.getenv("CHAT_SERVER_HOST", "127.0.0.1")
+PORT = int(os.getenv("CHAT_SERVER_PORT", "8000"))
+
+SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+# Requests with a larger body, or more headers, are rejected before anything is read into memory
+MAX_BODY_BYTES = int(os.getenv("CHAT_MAX_BODY_BYTES", str(64 * 1024)))
+MAX_HEADERS = 100
+# Sessions unused for this long are forgotten; their history stays on disk and is loaded again on the next turn
+SESSION_IDLE_SECONDS = float(os.getenv("CHAT_SESSION_IDLE_SECONDS", "900"))
+
+# One client for the whole process: every session streams over the same connection pool
+client = get_async_client()
+metrics = StreamMetrics()
+
+# Each active session's lock, so two requests for the same session can't interleave their history,
+# and when the session was last used
+sessions = {}
+
+stats = {
+    "started_at": time.monotonic(),
+    "sessions_served": 0,
+    "turns_served": 0,
+    "active_streams": 0,
+    "peak_active_streams": 0,
+}
+
+
+def _history_path(session_id):
+    return HISTORY_DIR / f"{session_id}.json"
+
+
+def _read_history(session_id):
+    history_path = _history_path(session_id)
+    if history_path.exists():
+        try:
+            with open(history_path, 'r') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, IOError):
+            return [SYSTEM_PROMPT]
+    else:
+        return [SYSTEM_PROMPT]
+
+
+def _write_history(session_id, messages):
+    HISTORY_DIR.mkdir(exist_ok=True)
+    # Write to a temp file and rename so a crash mid-write never corrupts the history
+    history_path = _history_path(session_id)
+    tmp_path = history_path.with_suffix('.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(messages, f, indent=2)
+    os.replace(tmp_path, history_path)
+
+
+async def load_history(session_id):
+    return await asyncio.to_thread(_read_history, session_id)
+
+
+async def save_history(session_id, messages):
+    await asyncio.to_thread(_write_history, session_id, list(messages))
+
+
+def get_stats():
+    """
+    Returns serving statistics for the process.
+
+    A single asyncio event loop runs on one core, so sessions per core is simply the number
+    of sessions this process has served (a session that expired and came back counts again).
+    CPU seconds show how much of that core was used.
+    """
+    uptime = time.monotonic() - stats["started_at"]
+    cpu_seconds = time.process_time()
+    connections = connection_stats()
+    return {
+        "uptime_seconds": round(uptime, 1),
+        "cores": 1,
+        "sessions_served_per_core": stats["sessions_served"],
+        "active_sessions": len(sessions),
+        "turns_served": stats["turns_served"],
+        "active_streams": stats["active_streams"],
+        "peak_active_streams": stats["peak_active_streams"],
+        "cpu_seconds": round(cpu_seconds, 2),
+        "turns_per_cpu_second": round(stats["turns_served"] / cpu_seconds, 1) if cpu_seconds else None,
+        "new_connections": connections["new_connections"],
+        "reused_connections": connections["reused_connections"],
+    }
+
+
+async def stream_chat(session_id, user_input, writer):
+    """
+    Streams the assistant's reply for one turn of a session as server-sent events.
+
+    Parameters:
+    session_id (str): The session the turn belongs to.
+    user_input (str): The user's message.
+    writer (asyncio.StreamWriter): The HTTP connection to stream the events to.
+    """
+    session = sessions.get(session_id)
+    if session is None:
+        session = sessions[session_id] = {"lock": asyncio.Lock(), "last_active": time.monotonic()}
+        stats["sessions_served"] += 1
+    session["last_active"] = time.monotonic()
+    async with session["lock"]:
+        messages = await load_history(session_id)
+        messages.append({"role": "user", "content": user_input})
+
+        stats["active_streams"] += 1
+        stats["peak_active_streams"] = max(stats["peak_active_streams"], stats["active_streams"])
+        try:
+            stream = create_instrumented_async(
+                client,
+                metrics,
+                messages=messages,
+                model=MODEL,
+                temperature=0.5,
+                max_tokens=1024,
+                top_p=1,
+                stop=None,
+            )
+
+            assistant_response = ""
+            try:
+                async for chunk in stream:
+                    delta_content = chunk.choices[0].delta.content
+                    if delta_content:
+                        assistant_response += delta_content
+                        writer.write(f"data: {json.dumps({'delta': delta_content})}\n\n".encode())
+                        # drain() applies backpressure so a slow client can't buffer unbounded output
+                        await writer.drain()
+
+                    if chunk.choices[0].finish_reason:
+                        usage = None
+                        if chunk.x_groq is not None and chunk.x_groq.usage is not None:
+                            usage = chunk.x_groq.usage.model_dump()
+                        writer.write(f"event: done\ndata: {json.dumps({'usage': usage})}\n\n".encode())
+                        await writer.drain()
+                        break
+            except APIError as exc:
+                # The 200 headers are already sent, so the failure can only be reported as an event.
+                # The turn isn't saved, so the user can simply send the message again
+                writer.write(f"event: error\ndata: {json.dumps({'error': str(exc)})}\n\n".encode())
+                await writer.drain()
+                return
+
+            messages.append({"role": "assistant", "content": assistant_response})
+            await save_history(session_id, messages)
+            stats["turns_served"] += 1
+        finally:
+            stats["active_streams"] -= 1
+            session["last_active"] = time.monotonic()
+
+
+async def expire_idle_sessions():
+    """Forgets sessions that have been idle for SESSION_IDLE_SECONDS, so memory doesn't grow with every session ever seen."""
+    while True:
+        await asyncio.sleep(min(60.0, SESSION_IDLE_SECONDS / 2))
+        cutoff = time.monotonic() - SESSION_IDLE_SECONDS
+        for session_id, session in list(sessions.items()):
+            if session["last_active"] < cutoff and not session["lock"].locked():
+                del sessions[session_id]
+
+
+async def send_response(writer, status, body, content_type="application/json"):
+    payload = body.encode()
+    writer.write(
+        f"HTTP/1.1 {status}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(payload)}\r\n"
+        "Connection: close\r\n\r\n".encode() + payload
+    )
+    await writer.drain()
+
+
+async def handle_connection(reader, writer):
+    """
+    Handles one HTTP connection.
+
+    Routes:
+    POST /chat/<session_id> with a JSON body {"message": "..."} streams the reply as server-sent events.
+    GET /stats returns the serving statistics as JSON.
+    GET /metrics returns the streaming latency histograms in the Prometheus text format.
+    """
+    try:
+        request_line = (await reader.readline()).decode().strip()
+        if not request_line:
+            return
+        method, path, _ = request_line.split(' ', 2)
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode().strip()
+            if not line:
+                break
+            if len(headers) >= MAX_HEADERS:
+                await send_response(writer, "431 Request Header Fields Too Large",
+                                    json.dumps({"error": "too many headers"}))
+                return
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if method == 'GET' and path == '/stats':
+            await send_response(writer, "200 OK", json.dumps(get_stats()))
+            return
+
+        if method == 'GET' and path == '/metrics':
+            await send_response(writer, "200 OK", metrics.to_prometheus(), "text/plain; version=0.0.4")
+            return
+
+        session_id = path[len('/chat/'):] if path.startswith('/chat/') else ''
+        if method != 'POST' or not SESSION_ID_PATTERN.match(session_id):
+            await send_response(writer, "404 Not Found", json.dumps({"error": "not found"}))
+            return
+
+        content_length = int(headers.get('content-length', 0))
+        if content_length < 0 or content_length > MAX_BODY_BYTES:
+            await send_response(writer, "413 Content Too Large",
+                                json.dumps({"error": f"the body must be at most {MAX_BODY_BYTES} bytes"}))
+            return
+        body = await reader.readexactly(content_length)
+        try:
+            user_input = json.loads(body)["message"]
+        except (json.JSONDecodeError, UnicodeDecodeError, KeyError, TypeError):
+            await send_response(writer, "400 Bad Request", json.dumps({"error": "expected {\"message\": ...}"}))
+            return
+        if not isinstance(user_input, str) or not user_input.strip():
+            await send_response(writer, "400 Bad Request", json.dumps({"error": "message must be a non-empty string"}))
+            return
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+        await stream_chat(session_id, user_input, writer)
+    except (ConnectionResetError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def main() -> None:
+    await warm_up_async_client(client)
+    expiry_task = asyncio.create_task(expire_idle_sessions())
+    server = await asyncio.start_server(handle_connection, HOST, PORT)
+    print(f"Chat server listening on http://{HOST}:{PORT}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        expiry_task.cancel()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\nServer stopped.")
+        print(json.dumps(get_stats(), indent=2))
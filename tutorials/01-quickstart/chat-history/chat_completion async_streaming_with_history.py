@@ -1,10 +1,11 @@
 import asyncio
-import os
-from groq import AsyncGroq
+from client_factory import get_async_client, warm_up_async_client
 
 async def main() -> None:
 
-    client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
+    client = get_async_client()
+    # Open a pooled connection while the user types their first question
+    warm_up = asyncio.create_task(warm_up_async_client(client))
 
 
     messages = [
@@ -12,7 +13,9 @@ async def main() -> None:
     ]
 
     while True:
-        user_input = input("Chat with history: ")
+        user_input = await asyncio.to_thread(input, "Chat with history: ")
+        # The first request reuses the warm-up's connection; awaiting a finished task returns at once
+        await warm_up
 
         messages.append({"role": "user", "content": user_input})
 
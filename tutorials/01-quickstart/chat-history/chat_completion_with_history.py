@@ -1,8 +1,7 @@
-from groq import Groq
-import os
+from client_factory import get_client
 
 
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+client = get_client()
 
 
 messages = [
@@ -0,0 +1,162 @@
+import bisect
+import json
+import threading
+import time
+
+# Bucket upper bounds, in seconds for timings and in tokens per second for throughput
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+THROUGHPUT_BUCKETS = (25, 50, 100, 200, 300, 500, 750, 1000, 1500, 2000)
+
+METRICS = {
+    "time_to_first_token_seconds": ("Time from sending the request to the first content token", LATENCY_BUCKETS),
+    "inter_token_gap_seconds": ("Time between consecutive content chunks", LATENCY_BUCKETS),
+    "tokens_per_second": ("Completion tokens per second as seen by the client", THROUGHPUT_BUCKETS),
+    "queue_time_seconds": ("x_groq.usage.queue_time reported by the API", LATENCY_BUCKETS),
+    "prompt_time_seconds": ("x_groq.usage.prompt_time reported by the API", LATENCY_BUCKETS),
+    "completion_time_seconds": ("x_groq.usage.completion_time reported by the API", LATENCY_BUCKETS),
+}
+
+
+def _label_value(value):
+    """Escapes a label value for the Prometheus text format, where backslash, quote and newline are special."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    """A fixed-bucket histogram in the Prometheus style (cumulative buckets, sum and count)."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        total = 0
+        for count in self.counts:
+            total += count
+            yield total
+
+
+class StreamMetrics:
+    """
+    Collects latency and throughput histograms for streamed chat completions, labelled by model.
+
+    Use create_instrumented / create_instrumented_async to record a stream, then export with
+    to_prometheus() or to_json().
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, metric, model, value):
+        with self._lock:
+            key = (metric, model)
+            if key not in self._histograms:
+                self._histograms[key] = Histogram(METRICS[metric][1])
+            self._histograms[key].observe(value)
+
+    def record_stream(self, model, request_start, token_times, usage):
+        """
+        Records the metrics of one finished stream.
+
+        Parameters:
+        model (str): The model the request was sent to.
+        request_start (float): time.perf_counter() when the request was sent.
+        token_times (list): time.perf_counter() of every chunk that carried content.
+        usage: The x_groq.usage object from the final chunk, or None.
+        """
+        if token_times:
+            self.observe("time_to_first_token_seconds", model, token_times[0] - request_start)
+            for previous, current in zip(token_times, token_times[1:]):
+                self.observe("inter_token_gap_seconds", model, current - previous)
+
+        if usage is not None:
+            for field in ("queue_time", "prompt_time", "completion_time"):
+                value = getattr(usage, field, None)
+                if value is not None:
+                    self.observe(f"{field}_seconds", model, value)
+            # Measure throughput from the first token so queueing and prompt processing don't count
+            if len(token_times) > 1 and usage.completion_tokens:
+                generation_time = token_times[-1] - token_times[0]
+                if generation_time > 0:
+                    self.observe("tokens_per_second", model, usage.completion_tokens / generation_time)
+
+    def to_prometheus(self):
+        """Returns all histograms in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for metric, (help_text, _) in METRICS.items():
+                series = [(model, h) for (name, model), h in sorted(self._histograms.items()) if name == metric]
+                if not series:
+                    continue
+                name = f"groq_stream_{metric}"
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for model, histogram in series:
+                    model = _label_value(model)
+                    bounds = [str(b) for b in histogram.buckets] + ["+Inf"]
+                    for bound, count in zip(bounds, histogram.cumulative_counts()):
+                        lines.append(f'{name}_bucket{{model="{model}",le="{bound}"}} {count}')
+                    lines.append(f'{name}_sum{{model="{model}"}} {histogram.sum}')
+                    lines.append(f'{name}_count{{model="{model}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        """Returns all histograms as a JSON string, grouped by model then metric."""
+        output = {}
+        with self._lock:
+            for (metric, model), histogram in sorted(self._histograms.items()):
+                output.setdefault(model, {})[metric] = {
+                    "buckets": dict(zip([str(b) for b in histogram.buckets] + ["+Inf"], histogram.cumulative_counts())),
+                    "sum": histogram.sum,
+                    "count": histogram.count,
+                }
+        return json.dumps(output, indent=2)
+
+
+def _track_chunk(chunk, token_times):
+    """Notes the arrival time of content chunks; returns (finished, usage)."""
+    if chunk.choices and chunk.choices[0].delta.content:
+        token_times.append(time.perf_counter())
+    if chunk.choices and chunk.choices[0].finish_reason:
+        return True, chunk.x_groq.usage if chunk.x_groq is not None else None
+    return False, None
+
+
+def create_instrumented(client, metrics, **kwargs):
+    """
+    Calls client.chat.completions.create with stream=True and yields its chunks unchanged,
+    recording the stream's metrics into `metrics` when the final chunk arrives.
+
+    Parameters:
+    client (Groq): The Groq API client.
+    metrics (StreamMetrics): Where to record the metrics.
+    **kwargs: Arguments for chat.completions.create.
+    """
+    request_start = time.perf_counter()
+    stream = client.chat.completions.create(stream=True, **kwargs)
+    token_times = []
+    for chunk in stream:
+        finished, usage = _track_chunk(chunk, token_times)
+        if finished:
+            metrics.record_stream(kwargs["model"], request_start, token_times, usage)
+        yield chunk
+
+
+async def create_instrumented_async(client, metrics, **kwargs):
+    """The AsyncGroq equivalent of create_instrumented; use it with `async for`."""
+    request_start = time.perf_counter()
+    stream = await client.chat.completions.create(stream=True, **kwargs)
+    token_times = []
+    async for chunk in stream:
+        finished, usage = _track_chunk(chunk, token_times)
+        if finished:
+            metrics.record_stream(kwargs["model"], request_start, token_times, usage)
+        yield chunk
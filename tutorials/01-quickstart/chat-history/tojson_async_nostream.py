@@ -1,12 +1,11 @@
 import asyncio
 import json
-import os
 from pathlib import Path
-from groq import AsyncGroq
+from client_factory import get_async_client, warm_up_async_client
 
 HISTORY_FILE = 'chat_history.json'
 
-async def load_history():
+def _read_history():
     history_path = Path(HISTORY_FILE)
     if history_path.exists():
         try:
@@ -17,17 +16,29 @@ async def load_history():
     else:
         return [{"role": "system", "content": "You are a helpful assistant."}]
 
-async def save_history(messages):
+def _write_history(messages):
     with open(HISTORY_FILE, 'w') as f:
         json.dump(messages, f, indent=2)
 
+async def load_history():
+    # File IO blocks, so run it on a worker thread instead of the event loop
+    return await asyncio.to_thread(_read_history)
+
+async def save_history(messages):
+    # Snapshot the list so later appends don't race with the background write
+    await asyncio.to_thread(_write_history, list(messages))
+
 async def main() -> None:
     messages = await load_history()
-    client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
+    client = get_async_client()
+    # Open a pooled connection while the user types their first question
+    warm_up = asyncio.create_task(warm_up_async_client(client))
 
     try:
         while True:
-            user_input = input("Chat with history: ")
+            user_input = await asyncio.to_thread(input, "Chat with history: ")
+            # The first request reuses the warm-up's connection; awaiting a finished task returns at once
+            await warm_up
             
             if user_input.lower() in ['exit', 'quit', 'q']:
                 break
@@ -1,7 +1,6 @@
 import json
-import os
 from pathlib import Path
-from groq import Groq
+from client_factory import get_client
 
 HISTORY_FILE = 'chat_history.json'
 
@@ -22,7 +21,7 @@ def save_history(messages):
 
 def main():
     messages = load_history()
-    client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+    client = get_client()
 
     try:
         while True:
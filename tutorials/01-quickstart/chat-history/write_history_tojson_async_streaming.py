@@ -1,12 +1,13 @@
 import asyncio
 import json
-import os
 from pathlib import Path
-from groq import AsyncGroq
+from client_factory import get_async_client, warm_up_async_client
+from stream_metrics import StreamMetrics, create_instrumented_async
 
 HISTORY_FILE = 'chat_history.json'
+METRICS_FILE = 'stream_metrics.prom'
 
-async def load_history():
+def _read_history():
     history_path = Path(HISTORY_FILE)
     if history_path.exists():
         try:
@@ -17,31 +18,46 @@ async def load_history():
     else:
         return [{"role": "system", "content": "You are a helpful assistant."}]
 
-async def save_history(messages):
+def _write_history(messages):
     with open(HISTORY_FILE, 'w') as f:
         json.dump(messages, f, indent=2)
 
+async def load_history():
+    # File IO blocks, so run it on a worker thread instead of the event loop
+    return await asyncio.to_thread(_read_history)
+
+async def save_history(messages):
+    # Snapshot the list so later appends don't race with the background write
+    await asyncio.to_thread(_write_history, list(messages))
+
 async def main() -> None:
     messages = await load_history()
-    client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
+    client = get_async_client()
+    # Open a pooled connection while the user types their first question
+    warm_up = asyncio.create_task(warm_up_async_client(client))
+    metrics = StreamMetrics()
 
     try:
         while True:
-            user_input = input("Chat with history: ")
+            user_input = await asyncio.to_thread(input, "Chat with history: ")
+            # The first request reuses the warm-up's connection; awaiting a finished task returns at once
+            await warm_up
             
             if user_input.lower() in ['exit', 'quit', 'q']:
                 break
 
             messages.append({"role": "user", "content": user_input})
 
-            stream = await client.chat.completions.create(
+            # Records time-to-first-token, inter-token gaps and x_groq usage timings
+            stream = create_instrumented_async(
+                client,
+                metrics,
                 messages=messages,
                 model="meta-llama/llama-4-scout-17b-16e-instruct",
                 temperature=0.5,
                 max_tokens=1024,
                 top_p=1,
                 stop=None,
-                stream=True,
             )
 
             assistant_response = ""
@@ -64,6 +80,8 @@ async def main() -> None:
         print("\nChat session interrupted.")
     finally:
         await save_history(messages)
+        with open(METRICS_FILE, 'w') as f:
+            f.write(metrics.to_prometheus())
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,212 @@
+import queue
+import threading
+import time
+from collections import deque
+
+from response_cache import cache_key, cached_stream
+
+_DONE = object()
+
+
+class _Attempt:
+    """One streamed request to one model/endpoint, run on its own thread."""
+
+    def __init__(self, name, client, model):
+        self.name = name
+        self.client = client
+        self.model = model
+        self.chunks = queue.Queue()
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+        self.error = None
+        self.stream = None
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        """
+        Cancels the attempt and closes its response right away, from the calling thread. The attempt's
+        own thread may be blocked waiting for the next chunk, so it can't be relied on to notice in time.
+        """
+        with self._lock:
+            self.cancelled.set()
+            stream = self.stream
+        if stream is not None:
+            try:
+                # Closing the response stops the server from generating tokens nobody will read
+                stream.close()
+            except Exception:
+                pass
+
+
+class HedgedChat:
+    """
+    Sends a streamed chat request to a primary model and, if no first token has arrived within
+    a p95-based delay, sends the same request to a hedge model or endpoint. Whichever stream
+    delivers its first token first wins; the other is cancelled and its response closed.
+
+    With a cache, a cacheable request that was answered before is replayed from the cache without
+    any request, and a new answer is cached once its stream completes, keyed by the primary model
+    even if the hedge won.
+
+    Parameters:
+    primary (tuple): (client, model) for the primary request.
+    hedge (tuple): (client, model) for the hedge. Can be the same client with another model,
+        or another client pointed at a different endpoint.
+    quantile (float): Which quantile of recent primary time-to-first-token to use as the hedge delay.
+    default_delay (float): Hedge delay in seconds until min_samples latencies have been observed.
+    min_delay (float): Lower bound for the hedge delay in seconds.
+    min_samples (int): How many latencies to collect before trusting the quantile.
+    max_hedge_rate (float): Upper bound on the fraction of requests that get hedged, to keep
+        the extra spend bounded.
+    window (int): How many recent latencies the quantile is computed over.
+    cache (ResponseCache): Optionally, the response cache to serve and record answers with.
+    """
+
+    def __init__(self, primary, hedge, quantile=0.95, default_delay=1.0, min_delay=0.05,
+                 min_samples=20, max_hedge_rate=0.1, window=500, cache=None):
+        self.primary = primary
+        self.hedge = hedge
+        self.cache = cache
+        self.quantile = quantile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.max_hedge_rate = max_hedge_rate
+        self._ttft_samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "hedged": 0,
+            "skipped_over_budget": 0,
+            "primary_wins": 0,
+            "hedge_wins": 0,
+        }
+
+    def hedge_delay(self):
+        """Returns how long to wait for the primary's first token before hedging."""
+        with self._lock:
+            samples = sorted(self._ttft_samples)
+        if len(samples) < self.min_samples:
+            return self.default_delay
+        index = min(len(samples) - 1, int(self.quantile * len(samples)))
+        return max(self.min_delay, samples[index])
+
+    def hedge_rate(self):
+        with self._lock:
+            return self.stats["hedged"] / self.stats["requests"] if self.stats["requests"] else 0.0
+
+    def _count(self, stat):
+        # Concurrent requests update the stats from their own threads
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _reserve_hedge(self, primary_failed):
+        """Counts a hedge if one is allowed, checking the budget and counting under one lock."""
+        with self._lock:
+            # Allow one hedge of slack so the first slow request can still be hedged
+            if primary_failed or self.stats["hedged"] < self.max_hedge_rate * self.stats["requests"] + 1:
+                self.stats["hedged"] += 1
+                return True
+            self.stats["skipped_over_budget"] += 1
+            return False
+
+    def _run(self, attempt, state, kwargs):
+        try:
+            stream = attempt.client.chat.completions.create(model=attempt.model, stream=True, **kwargs)
+            with attempt._lock:
+                attempt.stream = stream
+            try:
+                if attempt.cancelled.is_set():
+                    return
+                for chunk in stream:
+                    if attempt.cancelled.is_set():
+                        break
+                    has_token = bool(chunk.choices) and bool(
+                        chunk.choices[0].delta.content or chunk.choices[0].finish_reason)
+                    if has_token and state["winner"] is None:
+                        with state["condition"]:
+                            if state["winner"] is None:
+                                state["winner"] = attempt
+                                state["first_token_at"] = time.perf_counter()
+                                state["condition"].notify_all()
+                    if state["winner"] is not None and state["winner"] is not attempt:
+                        break
+                    attempt.chunks.put(chunk)
+            finally:
+                # Also covers an attempt cancelled before its response arrived
+                stream.close()
+        except Exception as exc:
+            attempt.error = exc
+        finally:
+            attempt.chunks.put(_DONE)
+            with state["condition"]:
+                attempt.done.set()
+                state["condition"].notify_all()
+
+    def _start(self, name, target, state, kwargs):
+        client, model = target
+        attempt = _Attempt(name, client, model)
+        threading.Thread(target=self._run, args=(attempt, state, kwargs), daemon=True).start()
+        return attempt
+
+    def stream(self, **kwargs):
+        """
+        Returns the chunks of whichever stream delivers a first token first, or the cached answer
+        replayed as chunks.
+
+        Parameters:
+        **kwargs: Arguments for chat.completions.create, except model and stream.
+
+        Returns:
+        iterator: ChatCompletionChunk objects, yielded as they arrive.
+        """
+        if self.cache is None or not self.cache.is_cacheable(**kwargs):
+            return self._hedged_stream(**kwargs)
+        key = cache_key(model=self.primary[1], **kwargs)
+        return cached_stream(self.cache, key, lambda: self._hedged_stream(**kwargs))
+
+    def _hedged_stream(self, **kwargs):
+        state = {"winner": None, "first_token_at": None, "condition": threading.Condition()}
+        started_at = time.perf_counter()
+        self._count("requests")
+
+        attempts = [self._start("primary", self.primary, state, kwargs)]
+
+        def decided():
+            return state["winner"] is not None or all(a.done.is_set() for a in attempts)
+
+        with state["condition"]:
+            state["condition"].wait_for(decided, timeout=self.hedge_delay())
+
+        if state["winner"] is None:
+            # A failed primary is always retried on the hedge target; a slow one only within budget
+            if self._reserve_hedge(primary_failed=attempts[0].done.is_set()):
+                attempts.append(self._start("hedge", self.hedge, state, kwargs))
+
+        with state["condition"]:
+            state["condition"].wait_for(decided)
+
+        winner = state["winner"]
+        for attempt in attempts:
+            if attempt is not winner:
+                attempt.cancel()
+
+        if winner is None:
+            errors = [f"{attempt.name}: {attempt.error!r}" for attempt in attempts if attempt.error is not None]
+            last_error = next((attempt.error for attempt in reversed(attempts) if attempt.error is not None), None)
+            raise RuntimeError(f"no attempt returned a token ({'; '.join(errors) or 'every stream ended empty'})") \
+                from last_error
+
+        self._count(f"{winner.name}_wins")
+        # When the hedge wins, the primary's latency is only known to be at least this long;
+        # recording that lower bound still pushes the quantile in the right direction
+        with self._lock:
+            self._ttft_samples.append(state["first_token_at"] - started_at)
+
+        while True:
+            chunk = winner.chunks.get()
+            if chunk is _DONE:
+                break
+            yield chunk
+        if winner.error is not None:
+            raise winner.error
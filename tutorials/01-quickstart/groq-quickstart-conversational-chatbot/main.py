@@ -1,12 +1,32 @@
 #set GROQ_API_KEY in the secrets
 
 import os
-from groq import Groq
+from client_factory import get_client, connection_stats
+from response_cache import ResponseCache, cached_completion
+from hedging import HedgedChat
 
-# Create the Groq client
-client = Groq(
-    api_key=os.environ.get("GROQ_API_KEY")
-)
+MODEL = "llama3-70b-8192"
+
+# Get the shared, pooled Groq client. A connection is opened in the background
+# while the user types, so the first request doesn't pay for DNS and TLS setup
+client = get_client()
+
+# Opt in to the response cache with GROQ_RESPONSE_CACHE=1. Only deterministic (temperature 0)
+# requests are cached unless GROQ_RESPONSE_CACHE_ALLOW_SAMPLING=1 is set as well
+cache = None
+if os.environ.get("GROQ_RESPONSE_CACHE") == "1":
+  cache = ResponseCache(
+      allow_nondeterministic=os.environ.get("GROQ_RESPONSE_CACHE_ALLOW_SAMPLING") == "1")
+
+# Opt in to hedging with GROQ_HEDGE_MODEL=<model>. When the primary model hasn't produced a first
+# token within its recent p95 latency, the same request is also sent to the hedge model and
+# whichever answers first wins. Hedged requests use the response cache too, if it is enabled
+hedger = None
+if os.environ.get("GROQ_HEDGE_MODEL"):
+  hedger = HedgedChat(primary=(client, MODEL),
+                      hedge=(client, os.environ["GROQ_HEDGE_MODEL"]),
+                      max_hedge_rate=float(os.environ.get("GROQ_MAX_HEDGE_RATE", "0.1")),
+                      cache=cache)
 
 # Set the system prompt
 system_prompt = {
@@ -18,21 +38,41 @@ system_prompt = {
 # Initialize the chat history
 chat_history = [system_prompt]
 
-while True:
-  # Get user input from the console
-  user_input = input("You: ")
-
-  # Append the user input to the chat history
-  chat_history.append({"role": "user", "content": user_input})
-
-  response = client.chat.completions.create(model="llama3-70b-8192",
-                                            messages=chat_history,
-                                            max_tokens=100,
-                                            temperature=1.2)
-  # Append the response to the chat history
-  chat_history.append({
-      "role": "assistant",
-      "content": response.choices[0].message.content
-  })
-  # Print the response
-  print("Assistant:", response.choices[0].message.content)
+try:
+  while True:
+    # Get user input from the console
+    user_input = input("You: ")
+
+    # Append the user input to the chat history
+    chat_history.append({"role": "user", "content": user_input})
+
+    if hedger is not None:
+      chunks = hedger.stream(messages=chat_history, max_tokens=100, temperature=1.2)
+    else:
+      chunks = cached_completion(client,
+                                 cache,
+                                 model=MODEL,
+                                 messages=chat_history,
+                                 max_tokens=100,
+                                 temperature=1.2,
+                                 stream=True)
+
+    # Print the response as it streams in, so the first token shows up as soon as it arrives
+    print("Assistant: ", end="", flush=True)
+    pieces = []
+    for chunk in chunks:
+      if chunk.choices and chunk.choices[0].delta.content:
+        pieces.append(chunk.choices[0].delta.content)
+        print(chunk.choices[0].delta.content, end="", flush=True)
+    print()
+    assistant_message = "".join(pieces)
+
+    # Append the response to the chat history
+    chat_history.append({
+        "role": "assistant",
+        "content": assistant_message
+    })
+except KeyboardInterrupt:
+  print(f"\nConnection stats: {connection_stats()}")
+  if hedger is not None:
+    print(f"Hedge stats: {hedger.stats} (hedge rate {hedger.hedge_rate():.1%})")
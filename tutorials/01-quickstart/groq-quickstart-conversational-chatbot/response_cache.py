@@ -0,0 +1,249 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from groq.types.chat import ChatCompletion, ChatCompletionChunk
+
+# Only these arguments change the response, so only they go into the cache key
+KEY_PARAMS = ("model", "messages", "temperature", "top_p", "max_tokens", "stop", "seed",
+              "response_format", "tools", "tool_choice", "frequency_penalty", "presence_penalty")
+
+
+def cache_key(**kwargs):
+    """
+    Returns a canonical hash of the request: model, messages and sampling parameters.
+    Dictionary ordering and whitespace don't affect the key.
+    """
+    request = {name: kwargs[name] for name in KEY_PARAMS if kwargs.get(name) is not None}
+    canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    An exact-match cache for chat completions with two tiers:
+    an in-memory LRU and an on-disk directory of JSON files, with a TTL for both and a total size
+    limit for the disk. The disk tier is indexed once at startup and the index is kept up to date,
+    so storing a response doesn't scan the directory.
+
+    Parameters:
+    cache_dir (str): Where to keep the on-disk tier.
+    max_memory_entries (int): How many responses the in-memory LRU holds.
+    ttl_seconds (float): How long an entry stays valid, counted from when its response was stored.
+    max_disk_bytes (int): When the on-disk tier grows past this, the oldest entries are evicted.
+    allow_nondeterministic (bool): Also cache requests with temperature > 0.
+        By default only deterministic (temperature 0) requests are cached.
+    """
+
+    def __init__(self, cache_dir='.response_cache', max_memory_entries=256, ttl_seconds=24 * 3600,
+                 max_disk_bytes=100 * 1024 * 1024, allow_nondeterministic=False):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_memory_entries = max_memory_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_bytes = max_disk_bytes
+        self.allow_nondeterministic = allow_nondeterministic
+        # key -> (stored_at, response), least recently used first
+        self._memory = OrderedDict()
+        # key -> (mtime, size) of the files on disk, oldest first
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        entries = []
+        for path in self.cache_dir.glob('*.json'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path.stem))
+        for mtime, size, key in sorted(entries):
+            self._disk[key] = (mtime, size)
+            self._disk_bytes += size
+        with self._lock:
+            self._evict_disk()
+
+    def is_cacheable(self, **kwargs):
+        return self.allow_nondeterministic or kwargs.get("temperature") == 0
+
+    def _expired(self, stored_at):
+        return time.time() - stored_at > self.ttl_seconds
+
+    def get(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and not self._expired(entry[0]):
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._memory[key]
+            disk_entry = self._disk.get(key)
+
+        response = None
+        if disk_entry is not None and not self._expired(disk_entry[0]):
+            try:
+                with open(self.cache_dir / f"{key}.json", 'r') as f:
+                    response = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                pass
+
+        with self._lock:
+            if response is None:
+                if disk_entry is not None and self._disk.get(key) == disk_entry:
+                    self._remove_disk(key)
+                self.misses += 1
+                return None
+            self._remember(key, disk_entry[0], response)
+            self.hits += 1
+            return response
+
+    def put(self, key, response):
+        path = self.cache_dir / f"{key}.json"
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(response, f)
+        size = tmp_path.stat().st_size
+        os.replace(tmp_path, path)
+        stored_at = time.time()
+        with self._lock:
+            self._remember(key, stored_at, response)
+            if key in self._disk:
+                self._disk_bytes -= self._disk.pop(key)[1]
+            self._disk[key] = (stored_at, size)
+            self._disk_bytes += size
+            self._evict_disk()
+
+    def _remember(self, key, stored_at, response):
+        self._memory[key] = (stored_at, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _remove_disk(self, key):
+        _, size = self._disk.pop(key)
+        self._disk_bytes -= size
+        (self.cache_dir / f"{key}.json").unlink(missing_ok=True)
+
+    def _evict_disk(self):
+        # Oldest first: expired entries go regardless, then the oldest until the tier fits
+        while self._disk:
+            key, (stored_at, _) = next(iter(self._disk.items()))
+            if not self._expired(stored_at) and self._disk_bytes <= self.max_disk_bytes:
+                break
+            self._remove_disk(key)
+
+
+def _replay_stream(response):
+    """Replays a cached completion as a stream of chunks, one word at a time, followed by its tool calls."""
+    choice = response["choices"][0]
+    pieces = re.findall(r'\S+\s*|\s+', choice["message"].get("content") or "")
+    base = {"id": response["id"], "object": "chat.completion.chunk",
+            "created": response["created"], "model": response["model"]}
+    yield ChatCompletionChunk.model_validate(
+        {**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]})
+    for piece in pieces:
+        yield ChatCompletionChunk.model_validate(
+            {**base, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]})
+    tool_calls = choice["message"].get("tool_calls")
+    if tool_calls:
+        yield ChatCompletionChunk.model_validate(
+            {**base, "choices": [{"index": 0, "finish_reason": None, "delta": {
+                "tool_calls": [dict(tool_call, index=index) for index, tool_call in enumerate(tool_calls)]}}]})
+    yield ChatCompletionChunk.model_validate(
+        {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": choice["finish_reason"]}]})
+
+
+def _record_stream(stream, cache, key):
+    """
+    Passes a live stream through while assembling the full completion, including any tool calls,
+    and caches it once complete.
+    """
+    content = []
+    tool_calls = {}
+    for chunk in stream:
+        if chunk.choices:
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content.append(delta.content)
+            # A tool call can arrive in pieces; its index says which call each piece belongs to
+            for piece in delta.tool_calls or []:
+                tool_call = tool_calls.setdefault(
+                    piece.index, {"id": None, "type": "function", "function": {"name": "", "arguments": ""}})
+                if piece.id:
+                    tool_call["id"] = piece.id
+                if piece.type:
+                    tool_call["type"] = piece.type
+                if piece.function is not None:
+                    if piece.function.name and not tool_call["function"]["name"]:
+                        tool_call["function"]["name"] = piece.function.name
+                    tool_call["function"]["arguments"] += piece.function.arguments or ""
+            if chunk.choices[0].finish_reason:
+                message = {"role": "assistant", "content": "".join(content) if content or not tool_calls else None}
+                if tool_calls:
+                    message["tool_calls"] = [tool_calls[index] for index in sorted(tool_calls)]
+                cache.put(key, {
+                    "id": chunk.id,
+                    "object": "chat.completion",
+                    "created": chunk.created,
+                    "model": chunk.model,
+                    "choices": [{
+                        "index": 0,
+                        "message": message,
+                        "finish_reason": chunk.choices[0].finish_reason,
+                    }],
+                })
+        yield chunk
+
+
+def cached_stream(cache, key, open_stream):
+    """
+    Returns the cached response for `key` replayed as a stream of chunks or, on a miss, the stream
+    returned by open_stream(), passed through and cached once complete.
+
+    Parameters:
+    cache (ResponseCache): The cache to use.
+    key (str): The request's cache_key().
+    open_stream (callable): Opens the live stream; only called on a miss.
+    """
+    cached = cache.get(key)
+    if cached is not None:
+        return _replay_stream(cached)
+    return _record_stream(open_stream(), cache, key)
+
+
+def cached_completion(client, cache, **kwargs):
+    """
+    A drop-in replacement for client.chat.completions.create that serves repeated requests from `cache`.
+
+    Non-streaming calls return a ChatCompletion; with stream=True a cached response is replayed
+    as a simulated stream of ChatCompletionChunk objects. Requests that aren't cacheable
+    (temperature > 0 without allow_nondeterministic, or cache=None) always go to the API.
+
+    Parameters:
+    client (Groq): The Groq API client.
+    cache (ResponseCache): The cache to use, or None to disable caching.
+    **kwargs: Arguments for chat.completions.create.
+    """
+    stream = kwargs.get("stream", False)
+    if cache is None or not cache.is_cacheable(**kwargs):
+        return client.chat.completions.create(**kwargs)
+
+    key = cache_key(**kwargs)
+    if stream:
+        return cached_stream(cache, key, lambda: client.chat.completions.create(**kwargs))
+
+    cached = cache.get(key)
+    if cached is not None:
+        return ChatCompletion.model_validate(cached)
+
+    response = client.chat.completions.create(**kwargs)
+    cache.put(key, response.model_dump(mode="json", exclude_none=True))
+    return response
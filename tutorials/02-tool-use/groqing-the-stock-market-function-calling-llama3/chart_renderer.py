@@ -0,0 +1,60 @@
+import atexit
+import threading
+
+import kaleido
+import plotly.io as pio
+
+
+class ChartRenderer:
+    """
+    Renders Plotly figures with one long-lived Kaleido process, instead of paying for a renderer
+    startup on every chart. The renderer is started by the first chart, so a session that never
+    renders one, or only writes JSON, never starts it.
+
+    Kaleido 1.x renders through a headless browser, which is started here as Kaleido's sync server;
+    Plotly uses it for every export while it runs, and it is stopped with the public
+    stop_sync_server() when the program exits. Kaleido 0.2.x keeps its Chromium subprocess in a
+    PlotlyScope, which is created once here and reused. It has no public shutdown method and needs
+    none: the scope stops the subprocess when it is garbage collected, and the subprocess exits
+    when its stdin pipe closes with this process.
+
+    Figures can also be written as Plotly JSON, for clients that render charts themselves; that
+    skips rasterising altogether.
+    """
+
+    def __init__(self):
+        self._scope = None
+        self._started = False
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._started:
+                return
+            if hasattr(kaleido, 'start_sync_server'):
+                kaleido.start_sync_server(silence_warnings=True)
+                atexit.register(kaleido.stop_sync_server, silence_warnings=True)
+            else:
+                from kaleido.scopes.plotly import PlotlyScope
+                self._scope = PlotlyScope()
+            self._started = True
+
+    def to_image(self, fig, format='png', width=None, height=None):
+        """Returns a figure rasterised (or, for svg and pdf, exported) as bytes."""
+        if not self._started:
+            self._start()
+        if self._scope is not None:
+            return self._scope.transform(fig, format=format, width=width, height=height)
+        return pio.to_image(fig, format=format, width=width, height=height)
+
+    def write_image(self, fig, path, format='png'):
+        with open(path, 'wb') as f:
+            f.write(self.to_image(fig, format=format))
+        return path
+
+    @staticmethod
+    def write_json(fig, path):
+        """Writes a figure as Plotly JSON, without rendering it, so no renderer has to be running."""
+        with open(path, 'w') as f:
+            f.write(pio.to_json(fig))
+        return path
@@ -1,15 +1,35 @@
 from langchain_groq import ChatGroq
 import os
-import yfinance as yf
 import pandas as pd
 
 from langchain_core.tools import tool
 from langchain_core.messages import AIMessage, SystemMessage, HumanMessage, ToolMessage
 
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
 import pandas as pd
 import plotly.graph_objects as go
 
+from chart_renderer import ChartRenderer
+from price_store import PriceStore
+from stock_info_cache import StockInfoCache
+
+# Each symbol's info payload is fetched once and reused: briefly for prices, for a day for static fields
+stock_info_cache = StockInfoCache(price_ttl=float(os.getenv('STOCK_PRICE_TTL_SECONDS', 15)),
+                                  static_ttl=float(os.getenv('STOCK_STATIC_TTL_SECONDS', 24 * 60 * 60)))
+
+# Daily closes are kept on disk per symbol, and only dates that haven't been downloaded yet are fetched
+price_store = PriceStore(os.getenv('PRICE_STORE_DIR', 'price_store'))
+
+# Tool calls from one model response are independent, so they run concurrently
+tool_executor = ThreadPoolExecutor(max_workers=8)
+
+# Charts are saved as plot.png by one renderer process, started by the first chart and kept for the session, or with
+# CHART_FORMAT=json as plot.json, the Plotly figure for clients that render it themselves
+chart_format = os.getenv('CHART_FORMAT', 'png')
+chart_renderer = ChartRenderer() if chart_format != 'json' else None
+
 
 @tool
 def get_stock_info(symbol, key):
@@ -18,9 +38,7 @@ def get_stock_info(symbol, key):
 
     If asked generically for 'stock price', use currentPrice
     '''
-    data = yf.Ticker(symbol)
-    stock_info = data.info
-    return stock_info[key]
+    return stock_info_cache.get(symbol, key)
 
 @tool
 def get_historical_price(symbol, start_date, end_date):
@@ -31,11 +49,22 @@ def get_historical_price(symbol, start_date, end_date):
     - start_date (date): Set explicitly, or calculated as 'end_date - date interval' (for example, if prompted 'over the past 6 months', date interval = 6 months so start_date would be 6 months earlier than today's date). Default to '1900-01-01' if vaguely asked for historical price. Start date must always be before the current date
     """
 
-    data = yf.Ticker(symbol)
-    hist = data.history(start=start_date, end=end_date)
-    hist = hist.reset_index()
-    hist[symbol] = hist['Close']
-    return hist[['Date', symbol]]
+    return price_store.get([symbol], start_date, end_date)[symbol]
+
+def get_historical_prices(symbols, start_date, end_date):
+    '''
+    Fetches historical stock prices for several symbols over the same dates from the local price store,
+    downloading the dates it doesn't have yet with one bulk request.
+
+    Parameters:
+    symbols (list): Stock ticker symbols.
+    start_date (str): The first date, inclusive.
+    end_date (str): The last date, exclusive.
+
+    Returns:
+    dict: Each symbol mapped to a DataFrame of its dates and closing prices, like get_historical_price returns.
+    '''
+    return price_store.get(symbols, start_date, end_date)
 
 def plot_price_over_time(historical_price_dfs):
     '''
@@ -43,22 +72,24 @@ def plot_price_over_time(historical_price_dfs):
 
     Parameters:
     historical_price_dfs (list): List of DataFrames containing historical stock prices.
+
+    Returns:
+    str: The path of the saved chart.
     '''
-    full_df = pd.DataFrame(columns=['Date'])
-    for df in historical_price_dfs:
-        full_df = full_df.merge(df, on='Date', how='outer')
+    # Align every symbol's prices on one shared date index in a single pass
+    full_df = pd.concat([df.set_index('Date') for df in historical_price_dfs], axis=1, join='outer').sort_index()
 
     # Create a Plotly figure
     fig = go.Figure()
 
     # Dynamically add a trace for each stock symbol in the DataFrame
-    for column in full_df.columns[1:]:  # Skip the first column since it's the date
-        fig.add_trace(go.Scatter(x=full_df['Date'], y=full_df[column], mode='lines+markers', name=column))
+    for column in full_df.columns:
+        fig.add_trace(go.Scatter(x=full_df.index, y=full_df[column], mode='lines+markers', name=column))
 
 
     # Update the layout to add titles and format axis labels
     fig.update_layout(
-        title='Stock Price Over Time: ' + ', '.join(full_df.columns.tolist()[1:]),
+        title='Stock Price Over Time: ' + ', '.join(full_df.columns.tolist()),
         xaxis_title='Date',
         yaxis_title='Stock Price (USD)',
         yaxis_tickprefix='$',
@@ -81,8 +112,10 @@ def plot_price_over_time(historical_price_dfs):
         )
     )
 
-    # Show the figure
-    fig.write_image("plot.png")
+    # Save the figure
+    if chart_format == 'json':
+        return ChartRenderer.write_json(fig, "plot.json")
+    return chart_renderer.write_image(fig, "plot." + chart_format, format=chart_format)
 
 
 def call_functions(llm_with_tools, user_prompt):
@@ -103,15 +136,29 @@ def call_functions(llm_with_tools, user_prompt):
     messages = [SystemMessage(system_prompt), HumanMessage(user_prompt)]
     ai_msg = llm_with_tools.invoke(messages)
     messages.append(ai_msg)
+
+    # Historical price requests over the same dates are coalesced into one bulk download;
+    # everything runs concurrently, and the outputs are collected in the order of the calls
+    history_requests = defaultdict(list)
+    for tool_call in ai_msg.tool_calls:
+        if tool_call['name'].lower() == 'get_historical_price':
+            args = tool_call["args"]
+            history_requests[(args['start_date'], args.get('end_date'))].append(args['symbol'])
+    history_futures = {dates: tool_executor.submit(get_historical_prices, requested_symbols, *dates)
+                       for dates, requested_symbols in history_requests.items()}
+    info_futures = {tool_call["id"]: tool_executor.submit(get_stock_info.invoke, tool_call["args"])
+                    for tool_call in ai_msg.tool_calls if tool_call['name'].lower() == 'get_stock_info'}
+
     historical_price_dfs = []
     symbols = []
     for tool_call in ai_msg.tool_calls:
-        selected_tool = {"get_stock_info": get_stock_info, "get_historical_price": get_historical_price}[tool_call["name"].lower()]
-        tool_output = selected_tool.invoke(tool_call["args"])
-        if tool_call['name'] == 'get_historical_price':
+        args = tool_call["args"]
+        if tool_call['name'].lower() == 'get_historical_price':
+            tool_output = history_futures[(args['start_date'], args.get('end_date'))].result()[args['symbol']]
             historical_price_dfs.append(tool_output)
             symbols.append(tool_output.columns[1])
         else:
+            tool_output = info_futures[tool_call["id"]].result()
             messages.append(ToolMessage(tool_output, tool_call_id=tool_call["id"]))
 
     if len(historical_price_dfs) > 0:
@@ -0,0 +1,201 @@
+import json
+import os
+import threading
+from datetime import date, timedelta
+
+import pandas as pd
+import yfinance as yf
+
+
+def _subtract(start, end, intervals):
+    """Returns the parts of [start, end) not covered by the sorted, merged intervals."""
+    missing = []
+    for covered_start, covered_end in intervals:
+        if covered_end <= start:
+            continue
+        if covered_start >= end:
+            break
+        if covered_start > start:
+            missing.append((start, covered_start))
+        start = max(start, covered_end)
+    if start < end:
+        missing.append((start, end))
+    return missing
+
+
+def _merge(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _normalize_date(value):
+    """Returns a date as YYYY-MM-DD, so dates like 2024-1-5 compare correctly as strings."""
+    return pd.Timestamp(value).date().isoformat()
+
+
+class PriceStore:
+    """
+    A local store of daily closing prices, one Parquet file per symbol, so historical prices are
+    downloaded from yfinance once and then served from disk.
+
+    The store records which date ranges it has fetched for each symbol (a range with no trading
+    days is still a fetched range), and a lookup only downloads the parts of the requested range
+    that are missing, with one bulk request for all symbols missing the same range. Today is never
+    recorded as fetched, since its bar changes until the market closes.
+
+    Prices are adjusted for splits and dividends, like Ticker.history returns them, as of the day
+    they were downloaded. A split or dividend after that day re-bases every earlier price, so the
+    first lookup of a symbol on a later day also downloads the days since its last download. If
+    they contain a split or dividend, the stored prices of that symbol are discarded and the
+    requested range is downloaded again on the new basis.
+
+    Parameters:
+    directory (str): Where to keep the Parquet files and the record of fetched ranges.
+    """
+
+    def __init__(self, directory='price_store'):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.coverage_path = os.path.join(directory, 'coverage.json')
+        self._lock = threading.Lock()
+        self._symbol_locks = {}
+        try:
+            with open(self.coverage_path, 'r') as f:
+                self.coverage = {symbol: {'ranges': [tuple(interval) for interval in entry['ranges']],
+                                          'downloaded_on': entry['downloaded_on']}
+                                 for symbol, entry in json.load(f).items() if isinstance(entry, dict)}
+        except (FileNotFoundError, json.JSONDecodeError, KeyError, TypeError):
+            self.coverage = {}
+
+    def _path(self, symbol):
+        return os.path.join(self.directory, f'{symbol}.parquet')
+
+    def _read(self, symbol):
+        try:
+            return pd.read_parquet(self._path(symbol))
+        except FileNotFoundError:
+            return pd.DataFrame({'Close': pd.Series(dtype='float64')}, index=pd.DatetimeIndex([], name='Date'))
+
+    def missing_ranges(self, symbol, start_date, end_date):
+        """Returns the (start, end) date ranges, end exclusive, of [start_date, end_date) not yet stored for a symbol."""
+        entry = self.coverage.get(symbol)
+        return _subtract(_normalize_date(start_date), _normalize_date(end_date), entry['ranges'] if entry else [])
+
+    @staticmethod
+    def _download(symbols, start_date, end_date):
+        """
+        Downloads daily closes for several symbols with one request.
+
+        Returns:
+        dict: Each symbol mapped to its closes and the dates of any splits or dividends in the range.
+        """
+        data = yf.download(symbols, start=start_date, end=end_date, auto_adjust=True, actions=True,
+                           progress=False, group_by='column')
+        downloaded = {}
+        for symbol in symbols:
+            if isinstance(data.columns, pd.MultiIndex):
+                bars = data.xs(symbol, axis=1, level=1) if symbol in data.columns.get_level_values(1) else None
+            else:
+                # Older yfinance versions return flat columns for a single symbol
+                bars = data
+            if bars is None or bars.empty:
+                downloaded[symbol] = (pd.Series(dtype='float64'), pd.DatetimeIndex([]))
+                continue
+            bars = bars.set_axis(pd.DatetimeIndex(bars.index).tz_localize(None).normalize(), axis=0)
+            actions = bars.reindex(columns=['Dividends', 'Stock Splits']).fillna(0)
+            downloaded[symbol] = (bars['Close'].dropna(), bars.index[(actions != 0).any(axis=1)])
+        return downloaded
+
+    def get(self, symbols, start_date, end_date=None):
+        """
+        Returns daily closing prices for several symbols, downloading only the dates not stored yet.
+
+        Parameters:
+        symbols (list): Stock ticker symbols.
+        start_date (str): The first date, inclusive, as YYYY-MM-DD.
+        end_date (str): The last date, exclusive, as YYYY-MM-DD. Defaults to tomorrow, to include today.
+
+        Returns:
+        dict: Each symbol mapped to a DataFrame with a Date column and a column of closing prices named after the symbol.
+        """
+        today = date.today().isoformat()
+        tomorrow = (date.today() + timedelta(days=1)).isoformat()
+        start_date = _normalize_date(start_date)
+        end_date = _normalize_date(end_date) if end_date else tomorrow
+        stored_symbols = {symbol: symbol.upper() for symbol in symbols}
+        unique_symbols = sorted(set(stored_symbols.values()))
+        locks = [self._symbol_lock(symbol) for symbol in unique_symbols]
+        for lock in locks:
+            lock.acquire()
+        try:
+            # Work out what each symbol is missing. A symbol last downloaded before today also
+            # fetches the days since, to find splits or dividends that re-based its prices
+            ranges_to_fetch = {}
+            for symbol in unique_symbols:
+                ranges = self.missing_ranges(symbol, start_date, end_date)
+                entry = self.coverage.get(symbol)
+                if entry is not None and entry['downloaded_on'] < today:
+                    ranges = _merge(ranges + [(entry['downloaded_on'], tomorrow)])
+                ranges_to_fetch[symbol] = ranges
+
+            # Group the symbols by the ranges they are missing, to download each range once for all of them
+            requests = {}
+            for symbol, ranges in ranges_to_fetch.items():
+                for missing_range in ranges:
+                    requests.setdefault(missing_range, []).append(symbol)
+            downloads = {symbol: [] for symbol in unique_symbols}
+            for (missing_start, missing_end), range_symbols in requests.items():
+                for symbol, (closes, action_dates) in self._download(range_symbols, missing_start, missing_end).items():
+                    downloads[symbol].append((missing_start, missing_end, closes, action_dates))
+
+            for symbol, pieces in downloads.items():
+                if not pieces:
+                    continue
+                entry = self.coverage.get(symbol)
+                stored = self._read(symbol)
+                rebased = entry is not None and not stored.empty and any(
+                    len(action_dates) and action_dates.max() >= pd.Timestamp(entry['downloaded_on'])
+                    for _, _, _, action_dates in pieces)
+                if rebased:
+                    # The stored prices are on the basis from before the split or dividend
+                    closes = self._download([symbol], start_date, end_date)[symbol][0]
+                    self._store(symbol, stored.iloc[0:0], [closes], [(start_date, end_date)], today, replace=True)
+                else:
+                    self._store(symbol, stored, [closes for _, _, closes, _ in pieces],
+                                [(piece_start, piece_end) for piece_start, piece_end, _, _ in pieces], today)
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+        historical_prices = {}
+        for symbol, stored_symbol in stored_symbols.items():
+            stored = self._read(stored_symbol)
+            in_range = stored[(stored.index >= pd.Timestamp(start_date)) & (stored.index < pd.Timestamp(end_date))]
+            historical_prices[symbol] = in_range.rename(columns={'Close': symbol}).reset_index()[['Date', symbol]]
+        return historical_prices
+
+    def _symbol_lock(self, symbol):
+        with self._lock:
+            return self._symbol_locks.setdefault(symbol, threading.Lock())
+
+    def _store(self, symbol, stored, closes_list, fetched_ranges, today, replace=False):
+        new = pd.concat([closes.to_frame('Close') for closes in closes_list])
+        new = new[~new.index.duplicated(keep='last')]
+        new.index.name = 'Date'
+        combined = pd.concat([stored[~stored.index.isin(new.index)], new]).sort_index()
+        tmp_path = self._path(symbol) + '.tmp'
+        combined.to_parquet(tmp_path)
+        os.replace(tmp_path, self._path(symbol))
+
+        # Today's bar isn't final, so today is never recorded as fetched
+        fetched_ranges = [(start, min(end, today)) for start, end in fetched_ranges if start < min(end, today)]
+        with self._lock:
+            previous_ranges = [] if replace or symbol not in self.coverage else self.coverage[symbol]['ranges']
+            self.coverage[symbol] = {'ranges': _merge(previous_ranges + fetched_ranges), 'downloaded_on': today}
+            with open(self.coverage_path, 'w') as f:
+                json.dump(self.coverage, f, indent=2)
@@ -0,0 +1,95 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import yfinance as yf
+
+# Info keys that move with the market during a trading session; every other key (address, sector,
+# officers, fiscal dates...) changes rarely and can be cached much longer
+PRICE_KEYS = frozenset([
+    'previousClose', 'open', 'dayLow', 'dayHigh', 'regularMarketPreviousClose', 'regularMarketOpen',
+    'regularMarketDayLow', 'regularMarketDayHigh', 'volume', 'regularMarketVolume', 'bid', 'ask', 'bidSize',
+    'askSize', 'marketCap', 'enterpriseValue', 'fiftyTwoWeekLow', 'fiftyTwoWeekHigh', 'trailingPE', 'forwardPE',
+    'priceToSalesTrailing12Months', 'priceToBook', 'pegRatio', 'trailingPegRatio', 'dividendYield',
+    'enterpriseToRevenue', 'enterpriseToEbitda', '52WeekChange', 'SandP52WeekChange', 'currentPrice',
+])
+
+
+class StockInfoCache:
+    """
+    Caches the yfinance info payload of each symbol, so asking for several fields of one ticker
+    makes a single request.
+
+    A cached payload answers price fields (PRICE_KEYS) for `price_ttl` seconds and every other field
+    for `static_ttl` seconds; a lookup that needs fresher data fetches the whole payload again, which
+    refreshes both. Concurrent lookups of the same symbol share one fetch instead of each making their own.
+
+    Parameters:
+    price_ttl (float): How long cached price fields are served, in seconds.
+    static_ttl (float): How long cached static fields are served, in seconds.
+    """
+
+    def __init__(self, price_ttl=15, static_ttl=24 * 60 * 60):
+        self.price_ttl = price_ttl
+        self.static_ttl = static_ttl
+        self.hits = 0
+        self.fetches = 0
+        self.coalesced = 0
+        self._entries = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def ttl(self, key):
+        """Returns how long a cached value of `key` may be served."""
+        return self.price_ttl if key is None or key in PRICE_KEYS else self.static_ttl
+
+    def get_info(self, symbol, key=None):
+        """
+        Returns the info payload of a symbol, fresh enough to answer `key`.
+
+        Parameters:
+        symbol (str): Stock ticker symbol.
+        key (str): The field the caller needs, which decides how old the cached payload may be.
+            If None, the payload is as fresh as the price TTL allows.
+
+        Returns:
+        dict: The yfinance info payload.
+        """
+        symbol = symbol.upper()
+        with self._lock:
+            entry = self._entries.get(symbol)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl(key):
+                self.hits += 1
+                return entry[1]
+            future = self._in_flight.get(symbol)
+            if future is None:
+                future = self._in_flight[symbol] = Future()
+                self.fetches += 1
+                fetching = True
+            else:
+                self.coalesced += 1
+                fetching = False
+
+        if not fetching:
+            return future.result()
+
+        try:
+            info = yf.Ticker(symbol).info
+        except Exception as exc:
+            with self._lock:
+                del self._in_flight[symbol]
+            future.set_exception(exc)
+            raise
+        with self._lock:
+            self._entries[symbol] = (time.monotonic(), info)
+            del self._in_flight[symbol]
+        future.set_result(info)
+        return info
+
+    def get(self, symbol, key):
+        """Returns one field of a symbol's info payload."""
+        return self.get_info(symbol, key)[key]
+
+    def stats(self):
+        return {"symbols": len(self._entries), "hits": self.hits, "fetches": self.fetches,
+                "coalesced": self.coalesced}
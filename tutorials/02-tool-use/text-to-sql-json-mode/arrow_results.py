@@ -0,0 +1,163 @@
+import atexit
+import os
+import threading
+import uuid
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+BATCH_ROWS = 64 * 1024
+
+# The Parquet files of spilled results that are still in use, removed at exit if they outlive the session
+_live_spill_paths = set()
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    _live_spill_paths.discard(path)
+
+
+@atexit.register
+def _remove_live_spill_files():
+    for path in list(_live_spill_paths):
+        _remove_file(path)
+
+
+class QueryResult:
+    """
+    A query result fetched as Arrow record batches.
+
+    Results of up to max_in_memory_rows rows are kept in memory in full. Larger results are
+    written to a Parquet file batch by batch as they arrive, and only their first rows are kept,
+    so memory stays bounded however many rows the query returns.
+
+    The Parquet file lives as long as someone uses the result. Whoever fetched it holds it, and so does
+    the result cache while it is cached; each calls release() when done, and the file is deleted once
+    the last one has. Files still in use when the process exits are deleted then.
+
+    Attributes:
+    table (pyarrow.Table): Every row, or only the first rows if the result was spilled.
+    num_rows (int): The total number of rows in the result.
+    spill_path (str): The Parquet file holding every row, or None if the result is in memory.
+    spill_bytes (int): The size of the Parquet file, or 0.
+    truncated (bool): Whether rows beyond the row limit were dropped.
+    """
+
+    def __init__(self, table, num_rows, spill_path=None, truncated=False):
+        self.table = table
+        self.num_rows = num_rows
+        self.spill_path = spill_path
+        self.spill_bytes = os.path.getsize(spill_path) if spill_path is not None else 0
+        self.truncated = truncated
+        self._users = 1
+        self._lock = threading.Lock()
+        if spill_path is not None:
+            _live_spill_paths.add(spill_path)
+
+    @property
+    def nbytes(self):
+        """The size of the result in memory plus, if it was spilled, on disk."""
+        return self.table.nbytes + self.spill_bytes
+
+    def acquire(self):
+        """Registers another user of the result, so its Parquet file is kept until they release it too."""
+        with self._lock:
+            self._users += 1
+        return self
+
+    def release(self):
+        """Releases the result; once no one is using it, the Parquet file of a spilled result is deleted."""
+        with self._lock:
+            self._users -= 1
+            if self._users > 0 or self.spill_path is None:
+                return
+            _remove_file(self.spill_path)
+            self.spill_path = None
+            self.spill_bytes = 0
+
+    def head(self, n_rows):
+        """Returns up to the first n_rows rows as a pandas DataFrame."""
+        return self.table.slice(0, n_rows).to_pandas()
+
+    def to_pandas(self):
+        """Returns the in-memory rows as a pandas DataFrame; for a spilled result, only its first rows."""
+        return self.table.to_pandas()
+
+
+def fetch_result(reader, max_in_memory_rows=100_000, preview_rows=1_000, spill_dir='results', row_limit=None):
+    """
+    Reads a RecordBatchReader into a QueryResult, spilling to Parquet once it grows past max_in_memory_rows.
+
+    Parameters:
+    reader (pyarrow.RecordBatchReader): The query's batches, e.g. from cursor.fetch_record_batch().
+    max_in_memory_rows (int): Results with more rows than this are spilled to Parquet.
+    preview_rows (int): How many rows of a spilled result to keep in memory.
+    spill_dir (str): Where spilled results are written.
+    row_limit (int): Stop reading after this many rows and mark the result as truncated.
+
+    Returns:
+    QueryResult: The result, which the caller must release() when done with it.
+    """
+    batches = []
+    kept_rows = 0
+    num_rows = 0
+    writer = None
+    spill_path = None
+    truncated = False
+
+    try:
+        for batch in reader:
+            if row_limit is not None and num_rows + batch.num_rows > row_limit:
+                batch = batch.slice(0, row_limit - num_rows)
+                truncated = True
+            num_rows += batch.num_rows
+
+            if writer is None and num_rows > max_in_memory_rows:
+                os.makedirs(spill_dir, exist_ok=True)
+                spill_path = os.path.join(spill_dir, f'{uuid.uuid4().hex}.parquet')
+                writer = pq.ParquetWriter(spill_path, reader.schema)
+                # Move what has been kept so far to the file, and keep only the preview rows of it
+                kept = pa.Table.from_batches(batches, schema=reader.schema)
+                writer.write_table(kept)
+                batches = kept.slice(0, preview_rows).to_batches()
+                kept_rows = min(kept.num_rows, preview_rows)
+
+            if writer is not None:
+                writer.write_batch(batch)
+                if kept_rows < preview_rows:
+                    batches.append(batch.slice(0, preview_rows - kept_rows))
+                    kept_rows += batches[-1].num_rows
+            else:
+                batches.append(batch)
+                kept_rows += batch.num_rows
+
+            if truncated:
+                break
+    except BaseException:
+        # A query interrupted halfway leaves no partial file behind
+        if writer is not None:
+            writer.close()
+            _remove_file(spill_path)
+        raise
+
+    if writer is not None:
+        writer.close()
+    return QueryResult(pa.Table.from_batches(batches, schema=reader.schema), num_rows, spill_path, truncated)
+
+
+def render_result(result, display_rows=50):
+    """
+    Returns the first display_rows rows of a result as a Markdown table, followed by a note on
+    where the remaining rows are, instead of rendering every row.
+    """
+    lines = [result.head(display_rows).to_markdown(index=False)]
+    if result.num_rows > display_rows:
+        lines.append(f"... showing {display_rows:,} of {result.num_rows:,} rows.")
+    if result.spill_path is not None:
+        lines.append(f"The full result is in {result.spill_path} while it is cached or in use.")
+    if result.truncated:
+        lines.append(f"The result was cut off after {result.num_rows:,} rows.")
+    return "\n".join(lines)
@@ -0,0 +1,198 @@
+import argparse
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import duckdb
+import yaml
+
+from client_factory import get_client
+from main import chat_with_groq, get_duckdb_session, sql_guard
+from schema_context import SchemaContextBuilder
+from sql_guard import QueryRejected
+
+STAGES = ('prompt', 'generation', 'execution', 'total')
+
+
+class StubLLM:
+    """
+    Answers from a file of responses instead of calling the API, so the rest of the pipeline can be
+    benchmarked offline and deterministically.
+
+    The bundled benchmark/stub_responses.json is hand-written, so it only smoke-tests the pipeline:
+    its results say nothing about any model's accuracy. A file saved with --record holds the
+    responses of a real model, along with the model's name, and replays them.
+
+    Parameters:
+    path (str): A JSON file mapping each question to the raw JSON-mode response for it, or a
+        recording: {"model": <name>, "responses": <that mapping>}.
+    latency (float): Seconds to sleep per call, to simulate the API.
+    """
+
+    def __init__(self, path, latency=0.0):
+        with open(path, 'r') as f:
+            responses = json.load(f)
+        # The name of the model the responses were recorded from, or None if they are hand-written
+        self.model = responses.get('model') if isinstance(responses.get('responses'), dict) else None
+        self.responses = responses['responses'] if self.model is not None else responses
+        self.latency = latency
+
+    def __call__(self, question, prompt):
+        time.sleep(self.latency)
+        return self.responses.get(question, json.dumps({"error": "no recorded response for this question"}))
+
+
+class GroqLLM:
+    """
+    Generates SQL with the Groq API, optionally recording every response so later runs can use StubLLM.
+
+    Parameters:
+    client (Groq): The Groq API client.
+    model (str): The model to benchmark.
+    """
+
+    def __init__(self, client, model):
+        self.client = client
+        self.model = model
+        self.recorded = {}
+
+    def __call__(self, question, prompt):
+        response = chat_with_groq(self.client, prompt, self.model, {"type": "json_object"})
+        self.recorded[question] = response
+        return response
+
+
+def normalize_rows(result, ordered):
+    """Turns a query result into comparable rows: numbers as rounded floats, rows sorted unless ordered."""
+    def normalize(value):
+        if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+            return round(float(value), 6)
+        return value
+
+    # Read by column position, since generated queries may repeat or rename columns
+    columns = [column.to_pylist() for column in result.table.columns]
+    rows = [tuple(normalize(value) for value in row) for row in zip(*columns)]
+    return rows if ordered else sorted(rows, key=repr)
+
+
+def percentile(values, fraction):
+    """The nearest-rank percentile of a list of values."""
+    values = sorted(values)
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def run_case(case, llm, base_prompt, schema_context, session):
+    """
+    Runs one question through prompt building, SQL generation and execution, and checks the result.
+
+    Returns:
+    dict: The question, whether the result matched, any error, and the time of each stage.
+    """
+    timings = {}
+    outcome = {'question': case['question'], 'correct': False, 'error': None, 'timings': timings}
+    start_time = time.perf_counter()
+
+    stage_start = time.perf_counter()
+    prompt = base_prompt.format(user_question=case['question'],
+                                schema_context=schema_context.build(case['question']))
+    timings['prompt'] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    try:
+        response = json.loads(llm(case['question'], prompt))
+    except json.JSONDecodeError as exc:
+        response = {'error': f'invalid JSON: {exc}'}
+    timings['generation'] = time.perf_counter() - stage_start
+
+    if 'sql' in response:
+        stage_start = time.perf_counter()
+        try:
+            # No result cache here: every run should pay for the execution it measures
+            result = session.execute(response['sql'], guard=sql_guard)
+            outcome['correct'] = normalize_rows(result, case.get('ordered', False)) == case['expected']
+        except (QueryRejected, duckdb.Error) as exc:
+            outcome['error'] = str(exc)
+        timings['execution'] = time.perf_counter() - stage_start
+    else:
+        outcome['error'] = response.get('error', 'no SQL in the response')
+
+    timings['total'] = time.perf_counter() - start_time
+    return outcome
+
+
+def main():
+    """
+    Benchmarks the text-to-SQL pipeline over a corpus of questions with known answers, and reports
+    execution-match accuracy and p50/p95 latency per stage. Run it from this directory:
+
+        python benchmark.py                   # offline smoke test, with hand-written stub responses
+        python benchmark.py --llm groq        # against the Groq API
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--llm', choices=['stub', 'groq'], default='stub')
+    parser.add_argument('--model', default='llama3-70b-8192')
+    parser.add_argument('--corpus', default='benchmark/corpus.yaml')
+    parser.add_argument('--responses', default='benchmark/stub_responses.json',
+                        help='responses used by the stub LLM: hand-written, or recorded with --record')
+    parser.add_argument('--record', action='store_true',
+                        help='with --llm groq, save the responses to --responses for later stub runs')
+    parser.add_argument('--stub-latency', type=float, default=0.0, help='simulated seconds per stub LLM call')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=1, help='how many times to run the corpus')
+    args = parser.parse_args()
+
+    session = get_duckdb_session()
+    schema_context = SchemaContextBuilder(session)
+    with open('prompts/base_prompt.txt', 'r') as file:
+        base_prompt = file.read()
+
+    with open(args.corpus, 'r') as f:
+        corpus = yaml.safe_load(f)
+    for case in corpus:
+        case['expected'] = normalize_rows(session.execute(case['sql']), case.get('ordered', False))
+
+    if args.llm == 'groq':
+        llm = GroqLLM(get_client(), args.model)
+    else:
+        llm = StubLLM(args.responses, args.stub_latency)
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        outcomes = list(executor.map(lambda case: run_case(case, llm, base_prompt, schema_context, session),
+                                     corpus * args.repeat))
+    wall_time = time.perf_counter() - start_time
+
+    for outcome in outcomes[:len(corpus)]:
+        status = 'PASS' if outcome['correct'] else 'FAIL'
+        print(f"{status}  {outcome['question']}" + (f"  ({outcome['error']})" if outcome['error'] else ''))
+
+    correct = sum(outcome['correct'] for outcome in outcomes)
+    if args.llm == 'groq':
+        print(f"\nModel: {args.model}, {len(outcomes)} runs, concurrency {args.concurrency}, {wall_time:.2f}s wall time")
+        print(f"Execution-match accuracy: {correct}/{len(outcomes)} ({correct / len(outcomes):.1%})\n")
+    elif llm.model is not None:
+        print(f"\nModel: {llm.model} (replayed from {args.responses}), {len(outcomes)} runs, "
+              f"concurrency {args.concurrency}, {wall_time:.2f}s wall time")
+        print(f"Execution-match accuracy: {correct}/{len(outcomes)} ({correct / len(outcomes):.1%})\n")
+    else:
+        # Hand-written responses are correct by construction, so a pass rate would measure nothing
+        print(f"\nSmoke test with hand-written stub responses, {len(outcomes)} runs, "
+              f"concurrency {args.concurrency}, {wall_time:.2f}s wall time")
+        print(f"{correct}/{len(outcomes)} stub queries ran and returned the expected rows "
+              f"(this checks the pipeline, not a model's accuracy)\n")
+    print(f"{'stage':<12}{'p50 (ms)':>10}{'p95 (ms)':>10}")
+    for stage in STAGES:
+        values = [outcome['timings'][stage] for outcome in outcomes if stage in outcome['timings']]
+        if values:
+            print(f"{stage:<12}{percentile(values, 0.5) * 1000:>10.1f}{percentile(values, 0.95) * 1000:>10.1f}")
+
+    if args.llm == 'groq' and args.record:
+        with open(args.responses, 'w') as f:
+            json.dump({'model': args.model, 'responses': llm.recorded}, f, indent=2)
+        print(f"\nRecorded {len(llm.recorded)} responses to {args.responses}")
+
+
+if __name__ == "__main__":
+    main()
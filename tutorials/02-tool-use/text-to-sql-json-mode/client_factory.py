@@ -0,0 +1 @@
+../../shared/client_factory.py
\ No newline at end of file
@@ -0,0 +1 @@
+../../shared/columnar_cache.py
\ No newline at end of file
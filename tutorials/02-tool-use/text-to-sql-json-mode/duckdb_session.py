@@ -0,0 +1,123 @@
+import hashlib
+import re
+import threading
+
+import duckdb
+
+from arrow_results import BATCH_ROWS, fetch_result
+from columnar_cache import ColumnarCache
+from result_cache import is_deterministic, normalize_sql, referenced_names
+
+
+class DuckDBSession:
+    """
+    A long-lived DuckDB database with every CSV file in `data_dir` registered once as a table
+    named after the file (employees.csv becomes the table employees).
+
+    The tables are views over Parquet copies of the CSV files (see ColumnarCache), so scans run
+    at columnar speed and large files aren't held in memory. If a CSV file changes, its Parquet
+    copy and view are rebuilt before the next query.
+
+    Each thread queries through its own cursor on the shared connection, so concurrent users
+    share the warm tables without re-scanning the CSVs or changing the working directory.
+
+    Parameters:
+    data_dir (str): The directory containing the CSV files.
+    max_in_memory_rows (int): Query results with more rows than this are spilled to Parquet.
+    spill_dir (str): Where spilled query results are written.
+    """
+
+    def __init__(self, data_dir='data', max_in_memory_rows=100_000, spill_dir='results'):
+        self.data_dir = data_dir
+        self.max_in_memory_rows = max_in_memory_rows
+        self.spill_dir = spill_dir
+        self.columnar_cache = ColumnarCache(data_dir)
+        self.conn = duckdb.connect(database=':memory:', read_only=False)
+        self.tables = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.load_tables()
+
+    def load_tables(self):
+        """Registers a view for every CSV file in the data directory whose table is missing or stale."""
+        with self._lock:
+            sources = self.columnar_cache.sources()
+            for table_name, csv_path in sources.items():
+                if table_name in self.tables and not self.columnar_cache.is_stale(table_name, csv_path):
+                    continue
+                parquet_path = self.columnar_cache.get_parquet_path(table_name, csv_path).replace("'", "''")
+                self.conn.execute(
+                    f'CREATE OR REPLACE VIEW "{table_name}" AS SELECT * FROM read_parquet(\'{parquet_path}\')')
+                self.tables[table_name] = csv_path
+            for table_name in set(self.tables) - set(sources):
+                self.conn.execute(f'DROP VIEW IF EXISTS "{table_name}"')
+                del self.tables[table_name]
+
+    def cursor(self):
+        """Returns this thread's cursor, creating it on first use."""
+        if not hasattr(self._local, 'cursor'):
+            self._local.cursor = self.conn.cursor()
+        return self._local.cursor
+
+    def rewrite_table_references(self, query):
+        """
+        Rewrites file references such as employees.csv or 'employees.csv' to the loaded table name,
+        so queries written against the CSV files keep working.
+        """
+        def replace(match):
+            table_name = match.group(2)
+            return f'"{table_name}"' if table_name in self.tables else match.group(0)
+
+        return re.sub(r'''(['"]?)\b([A-Za-z_][A-Za-z0-9_]*)\.csv\1''', replace, query)
+
+    def data_fingerprint(self, table_names):
+        """Returns a fingerprint of the source files behind the given tables, from their content hashes."""
+        manifest = self.columnar_cache.manifest
+        fingerprint = hashlib.sha256()
+        for table_name in sorted(table_names):
+            fingerprint.update(f"{table_name}:{manifest[table_name]['sha256']};".encode())
+        return fingerprint.hexdigest()
+
+    def execute(self, query, result_cache=None, guard=None):
+        """
+        Executes a SQL query on this thread's cursor and returns the result.
+
+        Parameters:
+        query (str): The SQL query to execute.
+        result_cache (QueryResultCache): If given, results are served from and stored in this cache,
+            keyed by the normalized SQL and a fingerprint of the files the query reads. Queries using
+            volatile functions such as CURRENT_DATE, now() or random() always run.
+        guard (SQLGuard): If given, the query is checked and its cost bounded by this guard,
+            which raises QueryRejected if the query is too expensive.
+
+        Returns:
+        QueryResult: The result, fetched as Arrow record batches and spilled to Parquet if it is large.
+            The caller must release() it when done, so the Parquet file of a spilled result can be deleted.
+        """
+        # A stat() per source file is cheap, and picks up edited or added CSVs without a restart
+        self.load_tables()
+
+        key = normalize_sql(query) if result_cache is not None else None
+        if key is not None and not is_deterministic(key):
+            result_cache = None
+        if result_cache is not None:
+            fingerprint = self.data_fingerprint(referenced_names(key) & set(self.tables))
+            cached_result = result_cache.get(key, fingerprint)
+            if cached_result is not None:
+                return cached_result
+
+        query = self.rewrite_table_references(query)
+        cursor = self.cursor()
+        if guard is not None:
+            guarded_query = guard.check(cursor, query)
+            with guard.time_limit(cursor):
+                reader = cursor.execute(guarded_query).fetch_record_batch(BATCH_ROWS)
+                result = fetch_result(reader, max_in_memory_rows=self.max_in_memory_rows,
+                                      spill_dir=self.spill_dir, row_limit=guard.row_limit)
+        else:
+            reader = cursor.execute(query).fetch_record_batch(BATCH_ROWS)
+            result = fetch_result(reader, max_in_memory_rows=self.max_in_memory_rows, spill_dir=self.spill_dir)
+
+        if result_cache is not None:
+            result_cache.put(key, fingerprint, result)
+        return result
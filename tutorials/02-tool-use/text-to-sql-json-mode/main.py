@@ -1,8 +1,18 @@
 import os
-from groq import Groq
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import json
-import duckdb
 import sqlparse
+from arrow_results import render_result
+from client_factory import get_client
+from duckdb_session import DuckDBSession
+from result_cache import QueryResultCache
+from schema_context import SchemaContextBuilder
+from semantic_cache import SemanticSQLCache
+from sql_guard import QueryRejected, SQLGuard
+from summary_input import build_summary_input
 
 def chat_with_groq(client, prompt, model, response_format):
     """
@@ -33,43 +43,79 @@ def chat_with_groq(client, prompt, model, response_format):
     return completion.choices[0].message.content
 
 
+_session = None
+
+# LLM-generated SQL for popular questions is often identical apart from formatting,
+# so results are cached by normalized SQL until the underlying files change
+result_cache = QueryResultCache()
+
+# LLM-generated SQL is EXPLAINed before it runs; expensive plans are rejected and sent back to the
+# model, and every query gets a row limit and a timeout
+sql_guard = SQLGuard(max_estimated_rows=int(os.getenv('SQL_MAX_ESTIMATED_ROWS', '50000000')),
+                     row_limit=int(os.getenv('SQL_ROW_LIMIT', '5000000')),
+                     timeout_seconds=float(os.getenv('SQL_TIMEOUT_SECONDS', '10')),
+                     allow_cross_products=os.getenv('SQL_ALLOW_CROSS_PRODUCTS') == '1')
+
+# How many times a question's SQL is generated before giving up on rejected queries
+MAX_SQL_ATTEMPTS = 3
+
+REJECTED_SQL_PROMPT = '''
+The following SQL was generated for this question, but was rejected before it ran:
+{sql}
+Reason: {reason}
+Write a cheaper query that answers the same question, for example by joining on a condition, filtering earlier, or aggregating instead of returning every row.
+'''
+
+
+def get_duckdb_session():
+    """
+    Returns the long-lived DuckDB session, registering the CSV files in 'data' as tables on first use.
+
+    Returns:
+    DuckDBSession: The shared session.
+    """
+    global _session
+    if _session is None:
+        _session = DuckDBSession('data')
+    return _session
+
+
 def execute_duckdb_query(query):
     """
-    This function executes a SQL query on a DuckDB database and returns the result.
+    This function executes a SQL query on the shared DuckDB session and returns the result.
+    Repeated queries are served from the result cache, and new ones are checked by the SQL guard.
 
     Parameters:
     query (str): The SQL query to execute.
 
     Returns:
-    DataFrame: The result of the query as a pandas DataFrame.
-    """
-    original_cwd = os.getcwd()
-    os.chdir('data')
-
-    try:
-        conn = duckdb.connect(database=':memory:', read_only=False)
-        query_result = conn.execute(query).fetchdf().reset_index(drop=True)
-    finally:
-        os.chdir(original_cwd)
+    QueryResult: The result of the query, fetched as Arrow record batches. Large results are
+        spilled to a Parquet file in 'results' instead of being held in memory; call release() on
+        the result when done with it so the file can be deleted.
 
-    return query_result
+    Raises:
+    QueryRejected: If the guard rejects the query or it times out.
+    """
+    return get_duckdb_session().execute(query, result_cache=result_cache, guard=sql_guard)
 
 
-def get_summarization(client, user_question, df, model):
+def build_summarization_prompt(user_question, df, token_budget=2000, strategy='auto'):
     """
-    This function generates a summarization prompt based on the user's question and the resulting data. 
-    It then sends this summarization prompt to the Groq API and retrieves the AI's response.
+    This function generates a summarization prompt based on the user's question and the resulting data.
+
+    Small results are included exactly; large ones as column statistics and a stratified sample
+    that fit within the token budget (see build_summary_input).
 
     Parameters:
-    client (Groqcloud): The Groq API client.
     user_question (str): The user's question.
-    df (DataFrame): The DataFrame resulting from the SQL query.
-    model (str): The AI model to use for the response.
-    
+    df (QueryResult): The result of the SQL query.
+    token_budget (int): The approximate number of prompt tokens the data may use.
+    strategy (str): 'auto', 'exact' or 'aggregate'; see build_summary_input.
+
     Returns:
-    str: The content of the AI's response to the summarization prompt.
+    str: The summarization prompt.
     """
-    prompt = '''
+    return '''
     A user asked the following question pertaining to local database tables:
     
     {user_question}
@@ -80,11 +126,94 @@ def get_summarization(client, user_question, df, model):
     {df}
     
     In a few sentences, summarize the data in the table as it pertains to the original user question. Avoid qualifiers like "based on the data" and do not comment on the structure or metadata of the table itself
-    '''.format(user_question = user_question, df = df)
+    '''.format(user_question = user_question, df = build_summary_input(df, token_budget, strategy))
+
+
+def get_summarization(client, user_question, df, model, token_budget=2000, strategy='auto'):
+    """
+    This function generates a summarization prompt based on the user's question and the resulting data. 
+    It then sends this summarization prompt to the Groq API and retrieves the AI's response.
+
+    Parameters:
+    client (Groqcloud): The Groq API client.
+    user_question (str): The user's question.
+    df (QueryResult): The result of the SQL query.
+    model (str): The AI model to use for the response.
+    token_budget (int): The approximate number of prompt tokens the data may use.
+    strategy (str): 'auto', 'exact' or 'aggregate'; see build_summary_input.
     
+    Returns:
+    str: The content of the AI's response to the summarization prompt.
+    """
+    prompt = build_summarization_prompt(user_question, df, token_budget, strategy)
+
     # Response format is set to 'None'
     return chat_with_groq(client,prompt,model,None)
 
+
+def stream_summarization(client, user_question, df, model, token_budget=2000, strategy='auto'):
+    """
+    The streaming version of get_summarization: yields the summary's text as it is generated.
+
+    Parameters:
+    client (Groqcloud): The Groq API client.
+    user_question (str): The user's question.
+    df (QueryResult): The result of the SQL query.
+    model (str): The AI model to use for the response.
+    token_budget (int): The approximate number of prompt tokens the data may use.
+    strategy (str): 'auto', 'exact' or 'aggregate'; see build_summary_input.
+
+    Yields:
+    str: The next piece of the summary.
+    """
+    prompt = build_summarization_prompt(user_question, df, token_budget, strategy)
+    stream = client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        stream=True,
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def consume_in_background(generator, timings, first_item_key):
+    """
+    Runs a generator on a worker thread, so its work overlaps with the caller's.
+
+    Parameters:
+    generator: The generator to consume. Nothing runs until the worker thread starts it.
+    timings (dict): The time of the first item, relative to now, is stored here under first_item_key.
+    first_item_key (str): The key to store the time to the first item under.
+
+    Returns:
+    queue.Queue: Receives each item, then an exception if the generator raised one, then None.
+    """
+    items = queue.Queue()
+    start_time = time.perf_counter()
+
+    def consume():
+        try:
+            for item in generator:
+                if first_item_key not in timings:
+                    timings[first_item_key] = time.perf_counter() - start_time
+                items.put(item)
+        except Exception as exc:
+            items.put(exc)
+        finally:
+            items.put(None)
+
+    threading.Thread(target=consume, daemon=True).start()
+    return items
+
+
+def print_timings(timings):
+    """Prints how long each stage of a turn took."""
+    labels = [('generation', 'SQL generation'), ('execution', 'execution'), ('render', 'render'),
+              ('summary_first_token', 'summary first token'), ('summary', 'summary')]
+    print(' | '.join(f"{label} {timings[key]:.3f}s" for key, label in labels if key in timings))
+
+
 def main():
     """
     The main function of the application. It handles user input, controls the flow of the application, 
@@ -93,14 +222,24 @@ def main():
 
     model = "llama3-70b-8192"
 
-    # Get the Groq API key and create a Groq client
-    groq_api_key = os.getenv('GROQ_API_KEY')
-    client = Groq(
-        api_key=groq_api_key
-    )
+    # The shared, pooled Groq client opens a connection in the background while the CSVs load
+    client = get_client()
 
     print("Welcome to the DuckDB Query Generator!")
-    print("You can ask questions about the data in the 'employees.csv' and 'purchases.csv' files.")
+    print("You can ask questions about the data in the CSV files in the 'data' folder.")
+
+    # Convert the CSV files and register them with DuckDB once, before the first question
+    session = get_duckdb_session()
+
+    # The prompt's schema section is generated from DuckDB's catalog, with only the tables relevant to each question
+    schema_context = SchemaContextBuilder(session)
+
+    # Questions that closely match one answered before reuse its SQL and skip the LLM call.
+    # Raise SEMANTIC_CACHE_THRESHOLD to make matching stricter
+    semantic_cache = SemanticSQLCache(threshold=float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.9')))
+
+    # Runs queries in the background so they overlap with printing the SQL
+    executor = ThreadPoolExecutor(max_workers=1)
 
     # Load the base prompt
     with open('prompts/base_prompt.txt', 'r') as file:
@@ -111,27 +250,81 @@ def main():
         user_question = input("Ask a question: ")
 
         if user_question:
-            # Generate the full prompt for the AI
-            full_prompt = base_prompt.format(user_question=user_question)
-
-            # Get the AI's response. Call with '{"type": "json_object"}' to use JSON mode
-            llm_response = chat_with_groq(client, full_prompt, model, {"type": "json_object"})
-
-            result_json = json.loads(llm_response)
-            if 'sql' in result_json:
+            timings = {'generation': 0.0, 'execution': 0.0}
+            sql_prompt = base_prompt.format(user_question=user_question,
+                                            schema_context=schema_context.build(user_question))
+            full_prompt = sql_prompt
+            cache_match = semantic_cache.lookup(user_question)
+            result = None
+
+            for attempt in range(MAX_SQL_ATTEMPTS):
+                start_time = time.perf_counter()
+                if cache_match is not None and attempt == 0:
+                    result_json = {'sql': cache_match.sql}
+                    stats = semantic_cache.stats()
+                    print(f"Reusing the SQL for a similar question ({cache_match.similarity:.2f}): {cache_match.question}")
+                    print(f"Semantic cache hit rate: {stats['hit_rate']:.0%}, "
+                          f"estimated time saved: {stats['estimated_seconds_saved']:.2f}s")
+                else:
+                    # Get the AI's response. Call with '{"type": "json_object"}' to use JSON mode
+                    llm_response = chat_with_groq(client, full_prompt, model, {"type": "json_object"})
+                    semantic_cache.record_llm_call(time.perf_counter() - start_time)
+
+                    result_json = json.loads(llm_response)
+                timings['generation'] += time.perf_counter() - start_time
+
+                if 'sql' not in result_json:
+                    break
                 sql_query = result_json['sql']
-                results_df = execute_duckdb_query(sql_query)
 
+                # Run the query while the SQL is formatted and printed
+                start_time = time.perf_counter()
+                query_future = executor.submit(execute_duckdb_query, sql_query)
                 formatted_sql_query = sqlparse.format(sql_query, reindent=True, keyword_case='upper')
-
                 print("```sql\n" + formatted_sql_query + "\n```")
-                print(results_df.to_markdown(index=False))
-
-                summarization = get_summarization(client,user_question,results_df,model)
-                print(summarization.replace('$','\\$'))
+                try:
+                    result = query_future.result()
+                except QueryRejected as exc:
+                    # Feed the rejection back to the model and ask for a cheaper query
+                    print("Query rejected:", exc)
+                    full_prompt = sql_prompt + REJECTED_SQL_PROMPT.format(sql=sql_query, reason=exc)
+                    continue
+                finally:
+                    timings['execution'] += time.perf_counter() - start_time
+                break
+
+            if result is not None:
+                if cache_match is None or sql_query != cache_match.sql:
+                    semantic_cache.add(user_question, sql_query)
+
+                # Start streaming the summary, then render the table while the model is still working on it
+                summary_start_time = time.perf_counter()
+                summary_chunks = consume_in_background(
+                    stream_summarization(client, user_question, result, model,
+                                         token_budget=int(os.getenv('SUMMARY_TOKEN_BUDGET', '2000')),
+                                         strategy=os.getenv('SUMMARY_STRATEGY', 'auto')),
+                    timings, 'summary_first_token')
+
+                try:
+                    start_time = time.perf_counter()
+                    print(render_result(result, display_rows=int(os.getenv('DISPLAY_ROWS', '50'))))
+                    timings['render'] = time.perf_counter() - start_time
+
+                    while (chunk := summary_chunks.get()) is not None:
+                        if isinstance(chunk, Exception):
+                            raise chunk
+                        print(chunk.replace('$','\\$'), end='', flush=True)
+                    print()
+                finally:
+                    # The summary has read the result by now, so its Parquet file can go unless it is cached
+                    result.release()
+                timings['summary'] = time.perf_counter() - summary_start_time
+                print_timings(timings)
             elif 'error' in result_json:
                 print("ERROR:", 'Could not generate valid SQL for this question')
                 print(result_json['error'])
+            else:
+                print("ERROR:", f'Every generated query was rejected after {MAX_SQL_ATTEMPTS} attempts')
 
 if __name__ == "__main__":
     main()
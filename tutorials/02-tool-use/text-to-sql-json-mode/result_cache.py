@@ -0,0 +1,123 @@
+import re
+import threading
+from collections import OrderedDict
+
+import sqlparse
+from sqlparse import tokens as T
+
+# Functions whose result can change between runs over the same data, so queries using them aren't cached
+VOLATILE_FUNCTIONS = re.compile(r'\b(current_date|current_time|current_timestamp|localtime|localtimestamp|now|today|'
+                                r'get_current_time|get_current_timestamp|transaction_timestamp|random|uuid|'
+                                r'gen_random_uuid|nextval|currval)\b', re.IGNORECASE)
+
+
+def normalize_sql(query):
+    """
+    Returns a canonical form of a SQL query, so queries that differ only in formatting share a cache entry.
+    Whitespace and comments are dropped, keywords are upper-cased and trailing semicolons are removed.
+    String literals and identifiers are kept as they are.
+    """
+    normalized_tokens = []
+    for statement in sqlparse.parse(query):
+        for token in statement.flatten():
+            if token.is_whitespace or token.ttype in T.Comment:
+                continue
+            if token.ttype in T.Punctuation and token.value == ';':
+                continue
+            normalized_tokens.append(token.value.upper() if token.is_keyword else token.value)
+    return ' '.join(normalized_tokens)
+
+
+def referenced_names(normalized_query):
+    """Returns every bare word in a normalized query, a superset of the tables it references."""
+    return set(re.findall(r'[A-Za-z_][A-Za-z0-9_]*', normalized_query))
+
+
+def is_deterministic(normalized_query):
+    """Whether a query always returns the same result for the same data, so its result can be cached."""
+    return VOLATILE_FUNCTIONS.search(normalized_query) is None
+
+
+def result_size(result):
+    """Returns the in-memory size of a query result in bytes."""
+    if hasattr(result, 'nbytes'):
+        # QueryResult or pyarrow.Table
+        return result.nbytes
+    return int(result.memory_usage(index=True, deep=True).sum())
+
+
+class QueryResultCache:
+    """
+    A memory-bounded LRU cache of query results keyed by normalized SQL.
+
+    Each entry also stores a fingerprint of the data files the query reads. A lookup with a
+    different fingerprint is a miss and drops the entry, so results are invalidated automatically
+    when a source file changes. Queries that use the current date or time, random() or another
+    volatile function can return a different result over the same data, so callers should check
+    is_deterministic() and not cache them.
+
+    The size of a spilled QueryResult includes its Parquet file. The cache holds each result it stores
+    and releases it when the entry is evicted or invalidated, so the file is deleted then unless a
+    caller is still using it. get() returns results already acquired for the caller, who must release
+    them when done.
+
+    Parameters:
+    max_bytes (int): The total size of cached results; least recently used entries are evicted beyond it.
+    max_result_bytes (int): Results larger than this are not cached at all.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, max_result_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_result_bytes = max_result_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, fingerprint):
+        """
+        Returns the cached result for `key`, or None if it is missing or its data has changed. A QueryResult
+        is returned acquired, so the caller must release() it when done.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == fingerprint:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1].acquire() if hasattr(entry[1], 'acquire') else entry[1]
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, fingerprint, result):
+        size = result_size(result)
+        if size > self.max_result_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if hasattr(result, 'acquire'):
+                result.acquire()
+            self._entries[key] = (fingerprint, result, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        _, result, size = self._entries.pop(key)
+        self.total_bytes -= size
+        # The Parquet file of a spilled result is deleted once whoever fetched it has released it too
+        if hasattr(result, 'release'):
+            result.release()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
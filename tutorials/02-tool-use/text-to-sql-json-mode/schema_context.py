@@ -0,0 +1,191 @@
+import json
+import os
+import re
+import threading
+
+# Bumped whenever the cached catalog's format changes, so an older cache file is recomputed
+CATALOG_VERSION = 2
+
+
+def _stem(word):
+    """A crude singular form, so 'purchases' in a question matches the purchases table and a purchase_id column."""
+    word = word.lower()
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith('es') and len(word) > 4 and word[-3] in 'sxz':
+        return word[:-2]
+    if word.endswith('s') and not word.endswith('ss') and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def _words(text):
+    words = set()
+    for word in re.findall(r'[A-Za-z0-9]+', text):
+        words.add(_stem(word))
+        # 'purchases' stems to 'purchas' like 'boxes' to 'box', so keep 'purchase' as well
+        if word.lower().endswith('ses'):
+            words.add(word.lower()[:-1])
+    return words
+
+
+def _is_text(column_type):
+    return column_type.upper().startswith('VARCHAR')
+
+
+def _foreign_keys(tables):
+    """
+    Returns the columns that reference another table's key, by naming convention: an x_id column
+    references the table whose singular name is x and which has an x_id column itself.
+
+    Returns:
+    dict: (table_name, column_name) mapped to the name of the referenced table.
+    """
+    keys = {}
+    for table_name, table in tables.items():
+        for column in table['columns']:
+            if column['name'].endswith('_id'):
+                keys.setdefault(column['name'], set()).add(table_name)
+    foreign_keys = {}
+    for column_name, table_names in keys.items():
+        entity = column_name[:-len('_id')].lower()
+        owners = [table_name for table_name in table_names
+                  if table_name.lower() in (entity, entity + 's', entity + 'es', entity[:-1] + 'ies')]
+        if len(owners) != 1:
+            continue
+        for table_name in table_names - {owners[0]}:
+            foreign_keys[(table_name, column_name)] = owners[0]
+    return foreign_keys
+
+
+class SchemaContextBuilder:
+    """
+    Builds the schema section of the text-to-SQL prompt from DuckDB's catalog instead of a hand-written description.
+
+    For every table it collects the columns and their types, the row count and each column's exact
+    number of distinct values. Text columns also get a few sample values (every value, if there are
+    few), and other columns their minimum and maximum. This is cached per data fingerprint, in memory
+    and on disk, so it is only recomputed when a source file changes.
+
+    For each question, only the tables relevant to it are included: tables whose name, columns or
+    sample values are mentioned, plus the tables their x_id columns reference (e.g. employees for
+    purchases.employee_id), so ids can be shown as names. Tables referencing a mentioned table are
+    not added, so a question about employees alone only gets the employees table.
+
+    Parameters:
+    session (DuckDBSession): The session whose tables are described.
+    cache_path (str): Where to persist the catalog description.
+    sample_values (int): How many sample values to show per column.
+    max_listed_values (int): Text columns with at most this many distinct values list all of them.
+    """
+
+    def __init__(self, session, cache_path=None, sample_values=3, max_listed_values=10):
+        self.session = session
+        self.cache_path = cache_path or os.path.join(session.columnar_cache.cache_dir, 'schema_context.json')
+        self.sample_values = sample_values
+        self.max_listed_values = max_listed_values
+        self._catalog = None
+        self._lock = threading.Lock()
+        try:
+            with open(self.cache_path, 'r') as f:
+                self._catalog = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+    def catalog(self):
+        """Returns the description of every table, recomputing it if the data has changed."""
+        self.session.load_tables()
+        fingerprint = self.session.data_fingerprint(self.session.tables)
+        with self._lock:
+            if (self._catalog is None or self._catalog['fingerprint'] != fingerprint
+                    or self._catalog.get('version') != CATALOG_VERSION):
+                self._catalog = {'version': CATALOG_VERSION, 'fingerprint': fingerprint, 'tables': self._introspect()}
+                with open(self.cache_path, 'w') as f:
+                    json.dump(self._catalog, f, indent=2)
+            return self._catalog['tables']
+
+    def _introspect(self):
+        cursor = self.session.cursor()
+        tables = {}
+        for table_name in sorted(self.session.tables):
+            row_count = cursor.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+            columns = []
+            for column_name, column_type, *_ in cursor.execute(f'DESCRIBE "{table_name}"').fetchall():
+                distinct_values, minimum, maximum = cursor.execute(
+                    f'SELECT COUNT(DISTINCT "{column_name}"), MIN("{column_name}"), MAX("{column_name}") '
+                    f'FROM "{table_name}"').fetchone()
+                column = {'name': column_name, 'type': column_type, 'distinct_values': distinct_values}
+                if _is_text(column_type):
+                    # Listing values only helps for text, where the model has to get the spelling right
+                    all_values = distinct_values <= self.max_listed_values
+                    limit = self.max_listed_values if all_values else self.sample_values
+                    column['values'] = [row[0] for row in cursor.execute(
+                        f'SELECT DISTINCT "{column_name}" FROM "{table_name}" '
+                        f'WHERE "{column_name}" IS NOT NULL ORDER BY 1 LIMIT {limit}').fetchall()]
+                    column['all_values'] = all_values
+                else:
+                    column['min'] = None if minimum is None else str(minimum)
+                    column['max'] = None if maximum is None else str(maximum)
+                columns.append(column)
+            tables[table_name] = {'row_count': row_count, 'columns': columns}
+        return tables
+
+    def relevant_tables(self, question, tables):
+        """Returns the names of the tables relevant to a question; every table if none are mentioned."""
+        question_words = _words(question)
+        question_text = question.lower()
+
+        mentioned = set()
+        for table_name, table in tables.items():
+            if _words(table_name.replace('_', ' ')) & question_words:
+                mentioned.add(table_name)
+                continue
+            for column in table['columns']:
+                # Key columns say nothing about a table's relevance; employee_id doesn't make a question
+                # about employees a question about purchases
+                if column['name'].endswith('_id'):
+                    continue
+                if _words(column['name'].replace('_', ' ')) & question_words or any(
+                        len(value) > 2 and value.lower() in question_text for value in column.get('values', [])):
+                    mentioned.add(table_name)
+                    break
+        if not mentioned:
+            return sorted(tables)
+
+        # Results show names rather than ids, so a table comes with the tables its x_id columns reference,
+        # but not with the tables that reference it
+        referenced = {referenced for (table_name, _), referenced in _foreign_keys(tables).items()
+                      if table_name in mentioned}
+        return sorted(mentioned | referenced)
+
+    def build(self, question):
+        """
+        Returns the schema context for a question: a description of each relevant table.
+
+        Parameters:
+        question (str): The user's question.
+
+        Returns:
+        str: The text to put into the prompt's {schema_context} placeholder.
+        """
+        tables = self.catalog()
+        foreign_keys = _foreign_keys(tables)
+        sections = []
+        for table_name in self.relevant_tables(question, tables):
+            table = tables[table_name]
+            lines = [f"Table: {table_name} ({table['row_count']} rows)", "Columns:"]
+            for column in table['columns']:
+                referenced = foreign_keys.get((table_name, column['name']))
+                if referenced is not None:
+                    detail = f"references {referenced}.{column['name']}"
+                elif 'values' in column:
+                    values = ", ".join(repr(value) for value in column['values'])
+                    if column['all_values']:
+                        detail = f"valid values are {values}"
+                    else:
+                        detail = f"{column['distinct_values']} distinct values, e.g. {values}"
+                else:
+                    detail = f"{column['distinct_values']} distinct values, from {column['min']} to {column['max']}"
+                lines.append(f"{column['name']} ({column['type']}): {detail}")
+            sections.append("\n".join(lines))
+        return "\n\n".join(sections)
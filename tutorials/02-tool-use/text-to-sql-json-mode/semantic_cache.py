@@ -0,0 +1,214 @@
+import json
+import os
+import re
+import threading
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+CacheMatch = namedtuple('CacheMatch', ['question', 'sql', 'similarity'])
+
+# Words that flip or narrow what a question asks for while barely changing its embedding:
+# "most" vs "least money spent" or "with" vs "without a piedpiper email" need different SQL
+NEGATIONS = frozenset(['not', 'no', 'never', 'none', 'nobody', 'nothing', 'neither', 'nor', 'without',
+                       'except', 'excluding', 'exclude', 'excludes', 'other', 'non'])
+COMPARATIVES = frozenset([
+    'most', 'least', 'more', 'less', 'fewer', 'fewest', 'top', 'bottom', 'max', 'min', 'maximum', 'minimum',
+    'highest', 'lowest', 'higher', 'lower', 'largest', 'smallest', 'larger', 'smaller', 'biggest', 'bigger',
+    'best', 'worst', 'better', 'worse', 'first', 'last', 'earliest', 'latest', 'earlier', 'later', 'oldest',
+    'newest', 'older', 'newer', 'recent', 'cheapest', 'priciest', 'cheaper', 'expensive', 'greater', 'greatest',
+    'above', 'below', 'over', 'under', 'before', 'after', 'since', 'until', 'between', 'average', 'total',
+    'sum', 'count', 'median', 'each', 'per', 'only', 'all', 'any', 'every',
+])
+SORT_DIRECTIONS = frozenset(['asc', 'ascending', 'desc', 'descending', 'increasing', 'decreasing',
+                             'alphabetical', 'alphabetically', 'reverse', 'reversed'])
+
+
+class HashingEmbedder:
+    """
+    A dependency-free embedding: hashed character trigrams of the lower-cased question, L2-normalized.
+    It catches rewordings, typos and word-order changes, but not synonyms.
+    """
+
+    name = 'hashing-trigrams'
+
+    def __init__(self, dimensions=4096):
+        self.dimensions = dimensions
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r'\w+', text.lower()):
+                padded = f' {word} '
+                for i in range(len(padded) - 2):
+                    vectors[row, zlib.crc32(padded[i:i + 3].encode()) % self.dimensions] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+
+class SentenceTransformerEmbedder:
+    """A sentence-transformers model, which also matches paraphrases that share few words."""
+
+    def __init__(self, model_name='all-MiniLM-L6-v2'):
+        from sentence_transformers import SentenceTransformer
+        self.name = model_name
+        self.model = SentenceTransformer(model_name)
+
+    def embed(self, texts):
+        return self.model.encode(texts, normalize_embeddings=True).astype(np.float32)
+
+
+def default_embedder():
+    """
+    Uses sentence-transformers when it is installed and its model loads, and the hashing embedder
+    otherwise, e.g. when the model can't be downloaded.
+    """
+    try:
+        return SentenceTransformerEmbedder()
+    except ImportError:
+        return HashingEmbedder()
+    except Exception as exc:
+        # Downloading or loading the model can fail with OSError, ValueError and others
+        print(f"Could not load the sentence-transformers model ({exc}); using the hashing embedder instead.")
+        return HashingEmbedder()
+
+
+def _numbers(text):
+    return sorted(re.findall(r'\d+(?:\.\d+)?', text))
+
+
+def _proper_nouns(text):
+    """Capitalized words that don't start a sentence, such as names: 'Bob Smith' in 'How much did Bob Smith spend?'"""
+    return {match.group(1).lower() for match in re.finditer(r'(?<![.?!]\s)(?<!^)\b([A-Z][\w-]*)', text.strip())}
+
+
+def _sql_literals(sql):
+    """The words of the string literals in a SQL query, ignoring LIKE wildcards."""
+    return {word.lower() for literal in re.findall(r"'((?:[^']|'')*)'", sql) for word in re.findall(r'\w+', literal)}
+
+
+def _qualifiers(text):
+    """The negations, comparatives, superlatives and sort directions in a question; contractions like didn't count as 'not'."""
+    words = set()
+    for word in re.findall(r"[a-z]+(?:n't|n’t)?", text.lower()):
+        if word.endswith(("n't", "n’t")) or word in NEGATIONS:
+            words.add('not')
+        elif word in COMPARATIVES or word in SORT_DIRECTIONS:
+            words.add(word)
+    return words
+
+
+def _same_entities(question, cached_question, cached_sql):
+    """
+    Guards against reusing SQL written for a different question: the questions must mention the same
+    numbers, proper nouns, negations, comparatives and sort directions, and every word of the cached
+    SQL's string literals must appear in the new question.
+    """
+    if _numbers(question) != _numbers(cached_question) or _qualifiers(question) != _qualifiers(cached_question):
+        return False
+    question_words = {word.lower() for word in re.findall(r'\w+', question)}
+    cached_words = {word.lower() for word in re.findall(r'\w+', cached_question)}
+    # Each question's proper nouns must appear in the other, in any case
+    if not (_proper_nouns(question) <= cached_words and _proper_nouns(cached_question) <= question_words):
+        return False
+    # Allow plurals, so a 'Tesla' literal still matches a question about Teslas
+    question_words |= {word[:-1] for word in question_words if word.endswith('s')}
+    return _sql_literals(cached_sql) <= question_words
+
+
+class SemanticSQLCache:
+    """
+    A local embedding index of past questions, mapped to the SQL that was generated for them
+    and executed successfully.
+
+    A new question whose embedding is at least `threshold` similar (cosine) to a past question
+    reuses that question's SQL without calling the LLM. Questions that mention different numbers
+    ("top 5" vs "top 10") or names ("Bob Smith" vs "Rob Smith") never match, however similar they
+    are otherwise, and neither do questions that don't mention the string literals of the cached SQL
+    or that differ in a negation, comparative or sort direction ("most" vs "least", "with" vs
+    "without", "ascending" vs "descending"). These guards are word lists, not an understanding of
+    the question, so a paraphrase that changes the meaning some other way can still reuse the wrong
+    SQL; raise the threshold, or use a sentence-transformers model, to make that less likely.
+
+    Parameters:
+    path (str): A JSON Lines file the question/SQL pairs are appended to, or None to keep them in memory only.
+    threshold (float): The minimum cosine similarity for a match.
+    embedder: An object with an embed(texts) method returning L2-normalized vectors.
+    """
+
+    def __init__(self, path='semantic_cache.jsonl', threshold=0.9, embedder=None):
+        self.path = path
+        self.threshold = threshold
+        self.embedder = embedder or default_embedder()
+        self.questions = []
+        self.sqls = []
+        # Embeddings are stored in the first rows of a buffer that doubles when full, so adding is amortized O(1)
+        self._matrix = None
+        self.hits = 0
+        self.misses = 0
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, 'r') as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+            if entries:
+                self.questions = [entry['question'] for entry in entries]
+                self.sqls = [entry['sql'] for entry in entries]
+                self._matrix = self.embedder.embed(self.questions)
+
+    @property
+    def vectors(self):
+        return None if self._matrix is None else self._matrix[:len(self.questions)]
+
+    def lookup(self, question):
+        """
+        Returns a CacheMatch for the most similar past question at or above the threshold, or None.
+        """
+        with self._lock:
+            match = None
+            if self.vectors is not None:
+                similarities = self.vectors @ self.embedder.embed([question])[0]
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold and _same_entities(question, self.questions[best],
+                                                                           self.sqls[best]):
+                    match = CacheMatch(self.questions[best], self.sqls[best], float(similarities[best]))
+            if match is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return match
+
+    def add(self, question, sql):
+        """Remembers the SQL generated for a question. Call this only once the SQL has executed successfully."""
+        with self._lock:
+            vector = self.embedder.embed([question])[0]
+            size = len(self.questions)
+            if self._matrix is None:
+                self._matrix = np.zeros((16, len(vector)), dtype=np.float32)
+            elif size == len(self._matrix):
+                self._matrix = np.concatenate([self._matrix, np.zeros_like(self._matrix)])
+            self._matrix[size] = vector
+            self.questions.append(question)
+            self.sqls.append(sql)
+            if self.path:
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps({'question': question, 'sql': sql}) + '\n')
+
+    def record_llm_call(self, seconds):
+        """Records the latency of an SQL generation call, used to estimate the latency saved by hits."""
+        self.llm_calls += 1
+        self.llm_seconds += seconds
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        average_llm_seconds = self.llm_seconds / self.llm_calls if self.llm_calls else 0.0
+        return {
+            "entries": len(self.questions),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "average_llm_seconds": average_llm_seconds,
+            "estimated_seconds_saved": self.hits * average_llm_seconds,
+        }
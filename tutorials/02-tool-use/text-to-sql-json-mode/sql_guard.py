@@ -0,0 +1,138 @@
+import json
+import re
+import threading
+from contextlib import contextmanager
+
+import duckdb
+import sqlparse
+
+
+class QueryRejected(Exception):
+    """Raised when a query is rejected before or during execution. The message explains why."""
+
+
+def _estimated_rows(text):
+    """Returns the estimated cardinality in a piece of EXPLAIN output, or None if there is none."""
+    # DuckDB prints estimated cardinalities as "EC: 123" in older versions and "~123 Rows" in newer ones
+    estimates = [int(value.replace(',', '')) for value in
+                 re.findall(r'EC:\s*([\d,]+)', text) + re.findall(r'~\s*([\d,]+)\s+[Rr]ows', text)]
+    return max(estimates) if estimates else None
+
+
+def _node_rows(node):
+    """Returns the estimated cardinality of a JSON plan node, or of its nearest descendant that has one."""
+    extra_info = node.get('extra_info') or {}
+    if isinstance(extra_info, dict):
+        estimate = extra_info.get('Estimated Cardinality')
+        rows = int(re.sub(r'[^\d]', '', str(estimate)) or 0) if estimate is not None else None
+    else:
+        rows = _estimated_rows(str(extra_info))
+    if rows is None and node.get('children'):
+        return _node_rows(node['children'][0])
+    return rows
+
+
+def _cross_products(node):
+    """Yields every CROSS_PRODUCT node of a JSON plan."""
+    if 'CROSS_PRODUCT' in str(node.get('name', '')):
+        yield node
+    for child in node.get('children') or []:
+        yield from _cross_products(child)
+
+
+class SQLGuard:
+    """
+    Checks LLM-generated SQL before it runs and bounds what it can cost when it does.
+
+    - Only a single SELECT statement is allowed.
+    - The query is EXPLAINed first, and rejected if any operator's estimated cardinality exceeds
+      max_estimated_rows, or if it has a cross product of two inputs that are each estimated at more
+      than one row. Crossing with a single row, like a CTE holding a grand total, is cheap and allowed.
+    - A row limit is injected, so at most row_limit rows (plus one, to detect truncation) are fetched.
+    - The query is interrupted if it runs for longer than timeout_seconds.
+
+    Parameters:
+    max_estimated_rows (int): The largest estimated cardinality allowed for any operator in the plan.
+    row_limit (int): The maximum number of rows returned.
+    timeout_seconds (float): Wall-clock limit for executing the query.
+    allow_cross_products (bool): Allow cross products of multi-row inputs, as long as they are within max_estimated_rows.
+    """
+
+    def __init__(self, max_estimated_rows=50_000_000, row_limit=5_000_000, timeout_seconds=10.0,
+                 allow_cross_products=False):
+        self.max_estimated_rows = max_estimated_rows
+        self.row_limit = row_limit
+        self.timeout_seconds = timeout_seconds
+        self.allow_cross_products = allow_cross_products
+
+    def check(self, cursor, query):
+        """
+        Parses and EXPLAINs a query, and returns it with the row limit injected.
+
+        Parameters:
+        cursor: The DuckDB cursor the query will run on.
+        query (str): The SQL query, with table references already resolved.
+
+        Returns:
+        str: The query to execute.
+
+        Raises:
+        QueryRejected: If the query isn't a single SELECT, doesn't plan, or its plan is too expensive.
+        """
+        statements = [statement for statement in sqlparse.parse(query) if statement.value.strip(' \n\t;')]
+        if len(statements) != 1:
+            raise QueryRejected(f"expected exactly one SQL statement, got {len(statements)}")
+        if statements[0].get_type() != 'SELECT':
+            raise QueryRejected(f"only SELECT queries are allowed, got {statements[0].get_type()}")
+        query = str(statements[0]).strip().rstrip(';')
+
+        try:
+            plan = "\n".join(row[-1] for row in cursor.execute(f"EXPLAIN {query}").fetchall())
+        except duckdb.Error as exc:
+            raise QueryRejected(f"the query could not be planned: {exc}") from exc
+
+        estimate = _estimated_rows(plan)
+        if estimate is not None and estimate > self.max_estimated_rows:
+            raise QueryRejected(f"the plan is estimated to produce {estimate:,} rows in one step, "
+                                f"more than the limit of {self.max_estimated_rows:,}")
+
+        if not self.allow_cross_products and 'CROSS_PRODUCT' in plan:
+            self._check_cross_products(cursor, query)
+
+        # Fetch one extra row so the caller can tell whether the result was truncated
+        return f"SELECT * FROM ({query}) AS guarded_result LIMIT {self.row_limit + 1}"
+
+    @staticmethod
+    def _check_cross_products(cursor, query):
+        """
+        Rejects a cross product whose inputs are both estimated at more than one row. The text plan
+        doesn't say which operators are a cross product's inputs, so this reads the JSON plan; DuckDB
+        versions without EXPLAIN (FORMAT JSON) rely on the cardinality limit alone.
+        """
+        try:
+            plan = json.loads(cursor.execute(f"EXPLAIN (FORMAT JSON) {query}").fetchall()[0][-1])
+        except (duckdb.Error, json.JSONDecodeError, IndexError):
+            return
+        for root in plan if isinstance(plan, list) else [plan]:
+            for node in _cross_products(root):
+                input_rows = [_node_rows(child) for child in node.get('children') or []]
+                if len(input_rows) == 2 and all(rows is None or rows > 1 for rows in input_rows):
+                    described = ' x '.join('?' if rows is None else f'{rows:,}' for rows in input_rows)
+                    raise QueryRejected(f"the plan has a cross product of two multi-row inputs ({described} rows); "
+                                        "join the tables on a condition")
+
+    @contextmanager
+    def time_limit(self, cursor):
+        """
+        Interrupts whatever the cursor is running, executing or fetching, if the block takes longer
+        than the timeout; the block then raises QueryRejected.
+        """
+        # interrupt() cancels the cursor's query from another thread
+        timer = threading.Timer(self.timeout_seconds, cursor.interrupt)
+        timer.start()
+        try:
+            yield
+        except duckdb.InterruptException as exc:
+            raise QueryRejected(f"the query ran for longer than {self.timeout_seconds:g} seconds") from exc
+        finally:
+            timer.cancel()
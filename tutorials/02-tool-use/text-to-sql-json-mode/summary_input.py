@@ -0,0 +1,203 @@
+import datetime
+import decimal
+
+import duckdb
+import pandas as pd
+
+STRATEGIES = ('auto', 'exact', 'aggregate')
+
+
+def estimate_tokens(text):
+    """A rough token count: about four characters per token for English text and CSV."""
+    return len(text) // 4 + 1
+
+
+def _as_frame(result):
+    """
+    Returns a query result as a DataFrame with dates as datetime64 and decimals as floats. Arrow
+    DATE and DECIMAL columns otherwise arrive as object columns and would be described as text.
+    """
+    if isinstance(result, pd.DataFrame):
+        df = result
+    else:
+        table = getattr(result, 'table', result)
+        df = table.to_pandas(date_as_object=False)
+    converted = {}
+    for column in df.columns:
+        if df[column].dtype != object:
+            continue
+        first = df[column].dropna().head(1)
+        if len(first) and isinstance(first.iloc[0], decimal.Decimal):
+            converted[column] = df[column].astype('float64')
+        elif len(first) and isinstance(first.iloc[0], datetime.date):
+            converted[column] = pd.to_datetime(df[column])
+    return df.assign(**converted) if converted else df
+
+
+def _trim_lines(text, token_budget):
+    """Drops whole lines from the end of a text until it fits in the token budget, saying how many were dropped."""
+    if estimate_tokens(text) <= token_budget:
+        return text
+    lines = text.splitlines()
+    while lines and estimate_tokens("\n".join(lines) + "\n... (cut to fit the token budget)\n") > token_budget:
+        lines.pop()
+    return "\n".join(lines) + "\n... (cut to fit the token budget)\n"
+
+
+def _fit(header, render_sample, n_rows, token_budget):
+    """
+    Returns the header followed by the largest sample that keeps the rendered text within the token budget.
+    The per-row estimate that picked n_rows comes from a few rows and can undercount, so the final text is
+    measured, and the sample shrunk in proportion to any overshoot until it fits.
+    """
+    header = _trim_lines(header, token_budget)
+    header_tokens = estimate_tokens(header)
+    while n_rows > 0:
+        text = header + render_sample(n_rows)
+        tokens = estimate_tokens(text)
+        if tokens <= token_budget:
+            return text
+        n_rows = min(n_rows - 1, n_rows * (token_budget - header_tokens) // max(1, tokens - header_tokens))
+    return header
+
+
+def describe_columns(df, top_values=5):
+    """Returns one line of statistics per column: numeric ranges, date ranges, or the most common values."""
+    lines = []
+    for column in df.columns:
+        series = df[column]
+        nulls = int(series.isna().sum())
+        null_text = f", {nulls} nulls" if nulls else ""
+        if pd.api.types.is_bool_dtype(series):
+            counts = series.value_counts().to_dict()
+            lines.append(f"- {column} (bool): {counts}{null_text}")
+        elif pd.api.types.is_numeric_dtype(series):
+            lines.append(f"- {column} (numeric): min {series.min()}, max {series.max()}, "
+                         f"mean {series.mean():.4g}, sum {series.sum():.6g}{null_text}")
+        elif pd.api.types.is_datetime64_any_dtype(series):
+            start, end = series.min(), series.max()
+            # DATE columns become midnight timestamps; show them as plain dates
+            if (series.dropna() == series.dropna().dt.normalize()).all():
+                start, end = start.date(), end.date()
+            lines.append(f"- {column} (date): from {start} to {end}{null_text}")
+        else:
+            counts = series.value_counts()
+            top = ", ".join(f"{value!r}: {count}" for value, count in counts.head(top_values).items())
+            lines.append(f"- {column}: {series.nunique()} distinct values, most common {top}{null_text}")
+    return "\n".join(lines)
+
+
+def stratified_sample(df, n_rows, max_groups=20):
+    """
+    Samples at most n_rows rows, stratified by the lowest-cardinality text column that has between
+    2 and max_groups distinct values. Each group gets a share of the rows proportional to its size,
+    and at least one row, so every group is represented (the largest groups, if there are more
+    groups than rows). Falls back to an even spread of rows.
+    """
+    if n_rows >= len(df):
+        return df
+    candidates = [column for column in df.columns
+                  if not pd.api.types.is_numeric_dtype(df[column]) and 2 <= df[column].nunique() <= max_groups]
+    if not candidates:
+        step = len(df) / n_rows
+        return df.iloc[[int(i * step) for i in range(n_rows)]]
+
+    column = min(candidates, key=lambda c: df[c].nunique())
+    groups = sorted(df.groupby(column, dropna=False, sort=False).indices.values(), key=len, reverse=True)[:n_rows]
+    quotas = [max(1, len(positions) * n_rows // len(df)) for positions in groups]
+    # The minimum of one row per group can push the total over n_rows; take the excess from the largest groups
+    for _ in range(sum(quotas) - n_rows):
+        largest = max(range(len(quotas)), key=lambda j: quotas[j])
+        quotas[largest] -= 1
+
+    positions = pd.concat([pd.Series(group).sample(quota, random_state=0) for group, quota in zip(groups, quotas)])
+    # Select by position from the original frame, so every column, including the stratification column, is kept
+    return df.iloc[sorted(positions)]
+
+
+def estimate_csv_tokens_per_row(df, sample_rows=100):
+    """Estimates the tokens per row of a DataFrame's CSV from its first rows, without serializing all of it."""
+    head = df.head(sample_rows)
+    return max(1, estimate_tokens(head.to_csv(index=False)) // max(1, len(head)))
+
+
+def _sample_size(header, tokens_per_row, token_budget, total_rows):
+    remaining_tokens = token_budget - estimate_tokens(header)
+    return max(0, min(total_rows, remaining_tokens // max(1, tokens_per_row)))
+
+
+def build_spilled_summary_input(result, token_budget=2000):
+    """
+    Builds the summary text for a result that was spilled to Parquet, without loading it:
+    DuckDB computes the column statistics and draws a reservoir sample straight from the file.
+    """
+    path = result.spill_path.replace("'", "''")
+    conn = duckdb.connect(database=':memory:')
+    try:
+        summary = conn.execute(f"SUMMARIZE SELECT * FROM read_parquet('{path}')").fetchdf()
+        lines = []
+        for row in summary.itertuples():
+            # SUMMARIZE has no mean for text or date columns
+            mean = f", mean {row.avg}" if row.avg is not None and not pd.isna(row.avg) else ""
+            lines.append(f"- {row.column_name} ({row.column_type}): min {row.min}, max {row.max}, "
+                         f"about {row.approx_unique} distinct values{mean}, {row.null_percentage}% nulls")
+        header = (f"The result has {result.num_rows} rows and {result.table.num_columns} columns; "
+                  f"only statistics and a sample are shown.\n"
+                  f"Column statistics (over all rows):\n" + "\n".join(lines) + "\n")
+
+        n_rows = _sample_size(header, estimate_csv_tokens_per_row(_as_frame(result.table.slice(0, 100))),
+                              token_budget, result.num_rows)
+        if n_rows == 0:
+            return _trim_lines(header, token_budget)
+        sample = _as_frame(conn.execute(
+            f"SELECT * FROM read_parquet('{path}') USING SAMPLE reservoir({n_rows} ROWS) REPEATABLE (0)").fetch_arrow_table())
+    finally:
+        conn.close()
+    # The reservoir sample is in random order, so its first rows are a random sample too
+    return _fit(header, lambda n: f"\nA random sample of {n} rows, as CSV:\n{sample.head(n).to_csv(index=False)}",
+                len(sample), token_budget)
+
+
+def build_summary_input(result, token_budget=2000, strategy='auto'):
+    """
+    Builds the text describing a query result for the summarization prompt, within a token budget.
+
+    Small results are sent exactly, as CSV. Large results are sent as their shape, per-column
+    statistics computed over every row, and a stratified sample of rows that fits in the rest of the budget.
+    Except with strategy 'exact', the rendered text is measured and trimmed until it fits the budget.
+
+    Parameters:
+    result (QueryResult or DataFrame): The query result.
+    token_budget (int): The approximate number of tokens the text may use.
+    strategy (str): 'auto' sends small results exactly and aggregates large ones,
+        'exact' always sends every row, 'aggregate' always sends statistics and a sample.
+        Results that were spilled to Parquet are always aggregated.
+
+    Returns:
+    str: The text to put into the prompt.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"strategy must be one of {STRATEGIES}, not {strategy!r}")
+
+    if getattr(result, 'spill_path', None) is not None:
+        return build_spilled_summary_input(result, token_budget)
+    df = _as_frame(result)
+
+    # Estimate the size of the CSV from its first rows, rather than serializing a large result just to measure it
+    tokens_per_row = estimate_csv_tokens_per_row(df)
+    if strategy == 'exact':
+        return f"All {len(df)} rows, as CSV:\n{df.to_csv(index=False)}"
+    if strategy == 'auto' and tokens_per_row * len(df) <= token_budget:
+        text = f"All {len(df)} rows, as CSV:\n{df.to_csv(index=False)}"
+        # The estimate said it fits; sending it exactly is only right if the rendered text really does
+        if estimate_tokens(text) <= token_budget:
+            return text
+
+    header = (f"The result has {len(df)} rows and {len(df.columns)} columns; only statistics and a sample are shown.\n"
+              f"Column statistics (over all rows):\n{describe_columns(df)}\n")
+    n_rows = _sample_size(header, tokens_per_row, token_budget, len(df))
+
+    def render_sample(n):
+        sample = stratified_sample(df, n)
+        return f"\nA representative sample of {len(sample)} rows, as CSV:\n{sample.to_csv(index=False)}"
+    return _fit(header, render_sample, n_rows, token_budget)
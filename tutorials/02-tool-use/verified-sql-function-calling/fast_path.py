@@ -0,0 +1,188 @@
+import difflib
+import json
+import random
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from query_index import tokenize
+
+Match = namedtuple('Match', ['query_name', 'confidence', 'margin', 'parameterised'])
+
+
+class SentenceTransformerEmbedder:
+    """Embeds text with a sentence-transformers model, caching the embeddings of query descriptions."""
+
+    def __init__(self, model_name='all-MiniLM-L6-v2'):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self._cache = {}
+
+    def similarity(self, question, texts):
+        missing = [text for text in texts if text not in self._cache]
+        if missing:
+            for text, embedding in zip(missing, self.model.encode(missing, normalize_embeddings=True)):
+                self._cache[text] = embedding
+        question_embedding = self.model.encode([question], normalize_embeddings=True)[0]
+        return [float(np.dot(question_embedding, self._cache[text])) for text in texts]
+
+
+class FastPathMatcher:
+    """
+    Decides when a question matches a verified query so closely that the query can be run without
+    asking the model to choose it.
+
+    The confidence of a match combines the overlap of the question's words with the query's name and
+    description and their character-level similarity, averaged with the cosine similarity of their
+    embeddings if an embedder is given. A match is used when its confidence reaches the threshold and
+    beats the runner-up by `margin`, counting every candidate. If the best match is a parameterised
+    query, it is never used, since its values have to be extracted from the question by the model.
+
+    The threshold is calibrated against the model: every time the model is asked instead, its choice
+    is recorded along with the local match, and once there are enough samples the threshold becomes
+    the lowest confidence at which local matches agreed with the model at least `target_precision`
+    of the time. So that confident matches are checked too, a fraction `audit_rate` of them is still
+    sent to the model. The samples are appended to `log_path` as JSON lines, so calibration carries over
+    between runs. Only the latest `max_samples` are used, and once the file holds twice that many it is
+    rewritten with just those, so it never grows without bound.
+
+    Parameters:
+    threshold (float): The confidence threshold used until there are enough calibration samples.
+    margin (float): How much more confident the best match must be than the second best.
+    target_precision (float): The agreement with the model that the calibrated threshold must reach.
+    min_samples (int): How many calibration samples are needed before the threshold is calibrated.
+    audit_rate (float): The fraction of confident matches sent to the model anyway, as calibration samples.
+    embedder: Optionally, an object with a similarity(question, texts) method, such as SentenceTransformerEmbedder.
+    log_path (str): Where to keep the calibration samples.
+    max_samples (int): How many of the latest calibration samples to keep.
+    """
+
+    def __init__(self, threshold=0.85, margin=0.1, target_precision=0.95, min_samples=20, audit_rate=0.05,
+                 embedder=None, log_path='fast_path_log.jsonl', max_samples=1000):
+        self.default_threshold = threshold
+        self.margin = margin
+        self.target_precision = target_precision
+        self.min_samples = min_samples
+        self.audit_rate = audit_rate
+        self.embedder = embedder
+        self.log_path = log_path
+        self.max_samples = max_samples
+        self.lookups = 0
+        self.hits = 0
+        self.seconds_saved = 0.0
+        self._llm_seconds = []
+        self._lock = threading.Lock()
+        self.samples = []
+        self._logged = 0
+        try:
+            with open(log_path, 'r') as f:
+                for line in f:
+                    self._logged += 1
+                    try:
+                        self.samples.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+        except FileNotFoundError:
+            pass
+        self.samples = self.samples[-max_samples:]
+        self.threshold = self._calibrate()
+
+    def _lexical_confidence(self, question, query_name, description):
+        question_terms = set(tokenize(question))
+        query_terms = set(tokenize(f"{query_name.replace('-', ' ')} {description}"))
+        if not question_terms or not query_terms:
+            return 0.0
+        overlap = len(question_terms & query_terms) / len(question_terms | query_terms)
+        ratio = difflib.SequenceMatcher(None, ' '.join(question.lower().split()).rstrip('?.!'),
+                                        description.lower()).ratio()
+        return (overlap + ratio) / 2
+
+    def match(self, question, candidates, verified_queries_dict):
+        """
+        Scores the candidate verified queries for a question.
+
+        Parameters:
+        question (str): The user's question.
+        candidates (list): The names of the candidate verified queries, e.g. from the search index.
+        verified_queries_dict (dict): The verified queries.
+
+        Returns:
+        Match: The best candidate with its confidence, its margin over the runner-up and whether it
+            takes parameters, or None if there are no candidates.
+        """
+        # Parameterised queries are scored too: a question that best matches one shouldn't go to the
+        # runner-up, and a close parameterised runner-up makes the best match less certain
+        if not candidates:
+            return None
+        descriptions = [verified_queries_dict[query_name].get('description', '') for query_name in candidates]
+        scores = [self._lexical_confidence(question, query_name, description)
+                  for query_name, description in zip(candidates, descriptions)]
+        if self.embedder is not None:
+            similarities = self.embedder.similarity(question, descriptions)
+            scores = [(score + similarity) / 2 for score, similarity in zip(scores, similarities)]
+
+        ranked = sorted(zip(scores, candidates), reverse=True)
+        runner_up = ranked[1][0] if len(ranked) > 1 else 0.0
+        return Match(ranked[0][1], ranked[0][0], ranked[0][0] - runner_up,
+                     bool(verified_queries_dict[ranked[0][1]].get('parameters')))
+
+    def is_confident(self, match):
+        """Whether a match is confident enough, and free of parameters, to run its query without asking the model."""
+        with self._lock:
+            self.lookups += 1
+            confident = (match is not None and not match.parameterised and match.confidence >= self.threshold
+                         and match.margin >= self.margin and random.random() >= self.audit_rate)
+            if confident:
+                self.hits += 1
+            return confident
+
+    def record_hit(self, seconds):
+        """Records a question answered locally, and the time it took, to estimate the latency saved."""
+        with self._lock:
+            if self._llm_seconds:
+                self.seconds_saved += max(0.0, np.median(self._llm_seconds) - seconds)
+
+    def record_llm_call(self, match, chosen_query_name, seconds):
+        """
+        Records the query the model chose for a question the fast path wasn't confident about, as a
+        calibration sample, and how long the model round trip took.
+        """
+        with self._lock:
+            self._llm_seconds = (self._llm_seconds + [seconds])[-100:]
+            if match is None or chosen_query_name is None:
+                return
+            sample = [round(match.confidence, 4), match.query_name == chosen_query_name]
+            self.samples = (self.samples + [sample])[-self.max_samples:]
+            self.threshold = self._calibrate()
+            if self._logged >= 2 * self.max_samples:
+                with open(self.log_path, 'w') as f:
+                    f.writelines(json.dumps(sample) + '\n' for sample in self.samples)
+                self._logged = len(self.samples)
+            else:
+                with open(self.log_path, 'a') as f:
+                    f.write(json.dumps(sample) + '\n')
+                self._logged += 1
+
+    def _calibrate(self):
+        if len(self.samples) < self.min_samples:
+            return self.default_threshold
+        # Walk down from the most confident sample while local matches still agree with the model often enough
+        threshold, agreed, total = 1.0, 0, 0
+        for confidence, agrees in sorted(self.samples, key=lambda sample: -sample[0]):
+            agreed += agrees
+            total += 1
+            if agreed / total < self.target_precision:
+                break
+            threshold = confidence
+        return max(threshold, 0.5)
+
+    def stats(self):
+        return {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "threshold": self.threshold,
+            "calibration_samples": len(self.samples),
+            "seconds_saved": self.seconds_saved,
+        }
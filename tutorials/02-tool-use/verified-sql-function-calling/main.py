@@ -1,72 +1,77 @@
 import os
-from groq import Groq
-import duckdb
-import yaml
-import glob
+import atexit
+import time
 import json
-
-def get_verified_queries(directory_path):
-    """
-    Reads YAML files from the specified directory, loads the verified SQL queries and their descriptions,
-    and stores them in a dictionary.
-
-    Parameters:
-        directory_path (str): The path to the directory containing the YAML files with verified queries.
-
-    Returns:
-        dict: A dictionary where the keys are the names of the YAML files (without the directory path and file extension)
-              and the values are the parsed content of the YAML files.
-    """
-    verified_queries_yaml_files = glob.glob(os.path.join(directory_path, '*.yaml'))
-    verified_queries_dict = {}
-    for file in verified_queries_yaml_files:
-        with open(file, 'r') as stream:
-            try:
-                file_name = file[len(directory_path):-5]
-                verified_queries_dict[file_name] = yaml.safe_load(stream)
-            except yaml.YAMLError as exc:
-                continue
-        
-    return verified_queries_dict
-
-
-def execute_duckdb_query_function_calling(query_name,verified_queries_dict):
+from concurrent.futures import ThreadPoolExecutor
+import duckdb
+from client_factory import get_client
+from columnar_cache import ColumnarCache
+from fast_path import FastPathMatcher, SentenceTransformerEmbedder
+from materialized_results import MaterializedResults
+from prepared_queries import PreparedQueries, parameters_schema
+from query_store import VerifiedQueryStore
+
+def execute_duckdb_query_function_calling(query_name,verified_queries_dict,parameters=None):
     """
-    Executes a SQL query from the verified queries dictionary using DuckDB and returns the result as a DataFrame.
+    Returns the result of a SQL query from the verified queries dictionary as a DataFrame. Results of queries
+    without parameters are materialized ahead of time and kept up to date, so this normally runs no SQL at all;
+    parameterised queries are executed as a prepared statement with bound parameters.
 
     Parameters:
         query_name (str): The name of the query to be executed, corresponding to a key in the verified queries dictionary.
         verified_queries_dict (dict): A dictionary containing verified queries, where the keys are query names and the values
                                       are dictionaries with query details including the SQL statement.
+        parameters (dict): Values for the query's parameters, if it has any; missing ones take their default.
 
     Returns:
         pandas.DataFrame: The result of the executed query as a DataFrame.
     """
-    
-    original_cwd = os.getcwd()
-    os.chdir('data')
-
-    query = verified_queries_dict[query_name]['sql']
-    
-    try:
-        conn = duckdb.connect(database=':memory:', read_only=False)
-        query_result = conn.execute(query).fetchdf().reset_index(drop=True)
-    finally:
-        os.chdir(original_cwd)
+    verified_query = verified_queries_dict[query_name]
+    if verified_query.get('parameters'):
+        return prepared_queries.execute(query_name, verified_query, parameters)
 
-    return query_result
+    return materialized_results.get(query_name, verified_query['sql'])
 
 
 model = "llama3-8b-8192"
 
-# Initialize the Groq client
-groq_api_key = os.getenv('GROQ_API_KEY')
-client = Groq(
-    api_key=groq_api_key
-)
+# The shared, pooled Groq client opens a connection in the background while the queries load
+client = get_client()
+
+# CSV files in 'data' are converted to Parquet on first use and rebuilt only when they change
+columnar_cache = ColumnarCache('data')
 
 directory_path = 'verified-queries/'
-verified_queries_dict = get_verified_queries(directory_path)
+# The verified queries and their search index are reloaded in the background when a YAML file changes
+verified_query_store = VerifiedQueryStore(directory_path,
+                                          poll_seconds=float(os.getenv('VERIFIED_QUERIES_POLL_SECONDS', 2)))
+verified_query_store.start()
+
+# Only the top-k verified queries for each question go into the prompt, so it doesn't grow with the library
+top_k = int(os.getenv('VERIFIED_QUERY_TOP_K', 5))
+# How many queries the model chooses from when none shares a word with the question
+fallback_k = int(os.getenv('VERIFIED_QUERY_FALLBACK_K', 50))
+
+# Precompute every verified query's result in the background and recompute it when its sources change
+materialized_results = MaterializedResults(columnar_cache,
+                                           refresh_seconds=float(os.getenv('MATERIALIZED_REFRESH_SECONDS', 300)))
+materialized_results.start(lambda: verified_query_store.snapshot().queries)
+
+# Parameterised queries run with their values bound as parameters, one cursor per thread
+prepared_queries = PreparedQueries(columnar_cache)
+
+# Errors a verified query can fail with; they are reported and the app keeps running
+query_errors = (KeyError, ValueError, TypeError, OSError, duckdb.Error)
+
+# Tool calls from one response run concurrently; each worker thread has its own DuckDB cursor
+tool_call_executor = ThreadPoolExecutor(max_workers=int(os.getenv('TOOL_CALL_WORKERS', 4)))
+
+# Questions that closely match a verified query's description are answered without calling the model.
+# Set FAST_PATH_EMBEDDING_MODEL (e.g. all-MiniLM-L6-v2) to also compare embeddings
+embedding_model = os.getenv('FAST_PATH_EMBEDDING_MODEL')
+fast_path = FastPathMatcher(threshold=float(os.getenv('FAST_PATH_THRESHOLD', 0.85)),
+                            embedder=SentenceTransformerEmbedder(embedding_model) if embedding_model else None)
+atexit.register(lambda: print(f"\nFast path: {fast_path.stats()}"))
 
 # Display the title and introduction of the application
 multiline_text = """
@@ -80,9 +85,42 @@ while True:
     # Get user input from the console
     user_input = input("You: ")
 
-    
-    #Simplify verified_queries_dict to just show query name and description
-    query_description_mapping = {key: subdict['description'] for key, subdict in verified_queries_dict.items()}
+    # Take one snapshot per question, so a reload in the meantime can't mix two versions of the queries
+    snapshot = verified_query_store.snapshot()
+    verified_queries_dict = snapshot.queries
+
+    # Retrieve the verified queries that best match the question
+    candidates = [query_name for query_name, _ in snapshot.index.search(user_input, top_k)]
+    if not candidates:
+        # No query shares a word with the question, e.g. because it uses synonyms, so let the model
+        # choose among all the queries, up to fallback_k of them
+        candidates = sorted(verified_queries_dict)[:fallback_k]
+    if not candidates:
+        print("There are no verified queries in the verified-queries folder.")
+        continue
+
+    # Run the matching query directly if the local matcher is confident about it
+    match_start = time.perf_counter()
+    match = fast_path.match(user_input, candidates, verified_queries_dict)
+    if fast_path.is_confident(match):
+        fast_path.record_hit(time.perf_counter() - match_start)
+        stats = fast_path.stats()
+        print('Query found: ', match.query_name,
+              f"(matched locally with confidence {match.confidence:.2f}; fast path hit rate {stats['hit_rate']:.0%}, "
+              f"{stats['seconds_saved']:.2f}s saved so far)")
+        try:
+            print(execute_duckdb_query_function_calling(query_name=match.query_name,
+                                                        verified_queries_dict=verified_queries_dict))
+        except query_errors as exc:
+            print(f"Could not run this query: {exc}")
+        continue
+
+    #Simplify the candidate queries to just show query name and description
+    query_description_mapping = {}
+    for key in candidates:
+        parameter_names = [parameter['name'] for parameter in verified_queries_dict[key].get('parameters') or []]
+        query_description_mapping[key] = verified_queries_dict[key]['description'] + (
+            f" (parameters: {', '.join(parameter_names)})" if parameter_names else "")
     
     # Step 1: send the conversation and available functions to the model
     # Define the messages to be sent to the Groq API
@@ -114,6 +152,7 @@ while True:
                         "query_name": {
                             "type": "string",
                             "description": "The name of the verified query (i.e. 'most-recent-purchases')",
+                            "enum": candidates,
                         }
                     },
                     "required": ["query_name"],
@@ -122,7 +161,13 @@ while True:
         }
     ]
 
+    # Offer the parameters of the candidate queries, if any take parameters
+    query_parameters = parameters_schema(candidates, verified_queries_dict)
+    if query_parameters is not None:
+        tools[0]["function"]["parameters"]["properties"]["parameters"] = query_parameters
+
     # Send the conversation and available functions to the Groq API
+    llm_start = time.perf_counter()
     response = client.chat.completions.create(
         model=model,
         messages=messages,
@@ -133,26 +178,41 @@ while True:
 
     # Extract the response message and any tool calls from the response
     response_message = response.choices[0].message
-    tool_calls = response_message.tool_calls
+    tool_calls = response_message.tool_calls or []
+
+    # Calibrate the fast path against the query the model chose
+    chosen_query_name = json.loads(tool_calls[0].function.arguments).get("query_name") if tool_calls else None
+    fast_path.record_llm_call(match, chosen_query_name, time.perf_counter() - llm_start)
 
     # Define a dictionary of available functions
     available_functions = {
         "execute_duckdb_query_function_calling": execute_duckdb_query_function_calling,
     }
 
-    # Iterate over the tool calls in the response
+    # Start every tool call in the response at once, so a multi-part question takes as long as its slowest query
+    pending_calls = []
     for tool_call in tool_calls:
         function_name = tool_call.function.name  # Get the function name
         function_to_call = available_functions[function_name]  # Get the function to call
         function_args = json.loads(tool_call.function.arguments)  # Parse the function arguments
-        print('Query found: ', function_args.get("query_name"))
-        
+
         # Call the function with the provided arguments
-        function_response = function_to_call(
+        future = tool_call_executor.submit(
+            function_to_call,
             query_name=function_args.get("query_name"),
-            verified_queries_dict=verified_queries_dict
+            verified_queries_dict=verified_queries_dict,
+            parameters=function_args.get("parameters")
         )
-
-    # Print the function response (query result)
-    print(function_response)
+        pending_calls.append((function_args, future))
+
+    if not pending_calls:
+        print(response_message.content or "The model didn't choose a verified query. Try rephrasing your question.")
+
+    # Print every function response (query result), in the order the model made the calls
+    for function_args, future in pending_calls:
+        print('Query found: ', function_args.get("query_name"), function_args.get("parameters") or '')
+        try:
+            print(future.result())
+        except query_errors as exc:
+            print(f"Could not run this query: {exc}")
 
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import duckdb
+import pyarrow.parquet as pq
+
+# Functions whose value changes over time, so a query using them has no lasting result
+TIME_FUNCTIONS = re.compile(r'\b(current_date|current_time|current_timestamp|localtime|localtimestamp|now|today|'
+                            r'get_current_time|get_current_timestamp|transaction_timestamp)\b', re.IGNORECASE)
+
+
+def depends_on_time(sql):
+    """Whether a query's result can change without its data changing, because it uses the current date or time."""
+    return TIME_FUNCTIONS.search(sql) is not None
+
+
+class MaterializedResults:
+    """
+    Precomputes the result of each verified query and serves it from memory, so a function call
+    returns without running any SQL.
+
+    Each result is stored as Parquet in `result_dir`, next to a manifest recording the SQL it was
+    computed from and the mtime and size of every CSV file the SQL reads, so results survive restarts.
+    A result is recomputed on the next lookup if its SQL or one of its sources has changed. Queries
+    that use the current date or time (CURRENT_DATE or now(), for example) are also recomputed once
+    their result is `refresh_seconds` old, by the background refresh or by the next lookup, and their
+    stored files are never trusted after a restart.
+
+    Returned DataFrames are shared between calls and must not be modified.
+
+    Parameters:
+    columnar_cache (ColumnarCache): Resolves the CSV files referenced by the SQL to Parquet copies.
+    result_dir (str): Where to keep the materialized results. Defaults to a materialized folder in the columnar cache.
+    refresh_seconds (float): How long the result of a query that uses the current date or time is served.
+    """
+
+    def __init__(self, columnar_cache, result_dir=None, refresh_seconds=300):
+        self.columnar_cache = columnar_cache
+        self.result_dir = result_dir or os.path.join(columnar_cache.cache_dir, 'materialized')
+        os.makedirs(self.result_dir, exist_ok=True)
+        self.refresh_seconds = refresh_seconds
+        self.manifest_path = os.path.join(self.result_dir, 'manifest.json')
+        self._results = {}
+        self._lock = threading.Lock()
+        self._query_locks = {}
+        try:
+            with open(self.manifest_path, 'r') as f:
+                self.manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.manifest = {}
+
+    def _source_paths(self, sql):
+        sources = self.columnar_cache.sources()
+        names = set(re.findall(r'\b([A-Za-z_][A-Za-z0-9_]*)\.csv\b', sql))
+        return sorted(sources[name] for name in names if name in sources)
+
+    @staticmethod
+    def _fingerprint(sql, source_paths):
+        sources = []
+        for path in source_paths:
+            stat = os.stat(path)
+            sources.append([path, stat.st_mtime_ns, stat.st_size])
+        return {'sql_sha256': hashlib.sha256(sql.encode()).hexdigest(), 'sources': sources}
+
+    def _query_lock(self, query_name):
+        with self._lock:
+            return self._query_locks.setdefault(query_name, threading.Lock())
+
+    def get(self, query_name, sql):
+        """
+        Returns the result of a verified query, materializing it first if it is missing or out of date.
+
+        Parameters:
+        query_name (str): The name of the verified query.
+        sql (str): Its SQL.
+
+        Returns:
+        pandas.DataFrame: The query result.
+        """
+        result = self._results.get(query_name)
+        if result is not None and result['fingerprint'] == self._fingerprint(sql, result['source_paths']):
+            if not (depends_on_time(sql) and self._aged(result)):
+                return result['df']
+            return self._update(query_name, sql, force=True)
+        return self._update(query_name, sql, force=False)
+
+    def _aged(self, result):
+        return time.time() - result['refreshed_at'] >= self.refresh_seconds
+
+    def _update(self, query_name, sql, force):
+        with self._query_lock(query_name):
+            source_paths = self._source_paths(sql)
+            fingerprint = self._fingerprint(sql, source_paths)
+            result = self._results.get(query_name)
+            if not force and result is not None and result['fingerprint'] == fingerprint:
+                return result['df']
+
+            parquet_path = os.path.join(self.result_dir, f'{query_name}.parquet')
+            entry = self.manifest.get(query_name)
+            if (not force and entry is not None and entry['fingerprint'] == fingerprint
+                    and os.path.exists(parquet_path) and not depends_on_time(sql)):
+                table = pq.read_table(parquet_path)
+                refreshed_at = entry['refreshed_at']
+            else:
+                table = self._materialize(query_name, sql, parquet_path, fingerprint)
+                refreshed_at = time.time()
+
+            # Replace the whole entry at once, so lookups that don't take the lock never see half of it
+            df = table.to_pandas()
+            self._results[query_name] = {'fingerprint': fingerprint, 'source_paths': source_paths,
+                                         'refreshed_at': refreshed_at, 'df': df}
+            return df
+
+    def _materialize(self, query_name, sql, parquet_path, fingerprint):
+        conn = duckdb.connect(database=':memory:')
+        try:
+            # .arrow() returns a RecordBatchReader on newer DuckDB versions; this is a Table on all of them
+            table = conn.execute(self.columnar_cache.rewrite_table_references(sql)).fetch_arrow_table()
+        finally:
+            conn.close()
+
+        tmp_path = parquet_path + '.tmp'
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, parquet_path)
+        with self._lock:
+            self.manifest[query_name] = {'fingerprint': fingerprint, 'refreshed_at': time.time()}
+            with open(self.manifest_path, 'w') as f:
+                json.dump(self.manifest, f, indent=2)
+        return table
+
+    def refresh(self, verified_queries_dict):
+        """
+        Materializes every verified query whose result is missing or out of date, and recomputes the
+        results of queries that use the current date or time once they are refresh_seconds old. The
+        previous result keeps being served while a new one is computed. Parameterised queries have no
+        single result, so they are skipped.
+        """
+        for query_name, verified_query in list(verified_queries_dict.items()):
+            if verified_query.get('parameters'):
+                continue
+            result = self._results.get(query_name)
+            aged = result is not None and depends_on_time(verified_query['sql']) and self._aged(result)
+            try:
+                self._update(query_name, verified_query['sql'], force=aged)
+            except Exception as exc:
+                # One broken query must not stop the others, or the background refresh, from running
+                print(f"Could not materialize {query_name}: {exc}")
+
+    def start(self, get_verified_queries):
+        """
+        Materializes every verified query in a background thread, then checks them every refresh_seconds.
+
+        Parameters:
+        get_verified_queries (callable): Returns the current verified queries dictionary.
+        """
+        def run():
+            while True:
+                self.refresh(get_verified_queries())
+                time.sleep(self.refresh_seconds)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
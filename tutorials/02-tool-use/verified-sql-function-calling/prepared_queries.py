@@ -0,0 +1,135 @@
+import datetime
+import math
+import threading
+
+import duckdb
+
+# Parameter types allowed in the verified query YAML files, and the JSON schema type for each
+PARAMETER_TYPES = {
+    'integer': {'type': 'integer'},
+    'number': {'type': 'number'},
+    'string': {'type': 'string'},
+    'boolean': {'type': 'boolean'},
+    'date': {'type': 'string', 'format': 'date'},
+}
+
+# The strings accepted for a boolean parameter; anything else is rejected rather than read as false
+BOOLEAN_STRINGS = {'true': True, 'yes': True, '1': True, 'false': False, 'no': False, '0': False}
+
+
+def _to_value(parameter, value):
+    """Validates a parameter value against its declared type and returns it as the Python value to bind."""
+    parameter_type = parameter.get('type', 'string')
+    if not isinstance(value, (str, int, float, bool)):
+        raise ValueError(f"parameter {parameter['name']} must be a single {parameter_type} value, got {value!r}")
+    try:
+        if parameter_type == 'integer':
+            # bool is a subclass of int, but true isn't a count of days
+            if isinstance(value, bool) or isinstance(value, float) and not value.is_integer():
+                raise ValueError
+            return int(value)
+        if parameter_type == 'number':
+            if isinstance(value, bool):
+                raise ValueError
+            value = float(value)
+            if not math.isfinite(value):
+                raise ValueError
+            return value
+        if parameter_type == 'boolean':
+            if isinstance(value, str):
+                return BOOLEAN_STRINGS[value.strip().lower()]
+            if isinstance(value, float) or value not in (0, 1):
+                raise ValueError
+            return bool(value)
+        if parameter_type == 'date':
+            return datetime.date.fromisoformat(str(value))
+    except (ValueError, KeyError) as exc:
+        raise ValueError(f"parameter {parameter['name']} must be of type {parameter_type}, got {value!r}") from exc
+    return str(value)
+
+
+def parameters_schema(query_names, verified_queries_dict):
+    """
+    Builds the JSON schema of the tool's `parameters` argument: the union of the parameters of the
+    given verified queries, each described along with the queries that use it.
+
+    Returns:
+    dict: A JSON schema object, or None if none of the queries take parameters.
+    """
+    properties = {}
+    for query_name in query_names:
+        for parameter in verified_queries_dict[query_name].get('parameters') or []:
+            if parameter['name'] not in properties:
+                properties[parameter['name']] = dict(PARAMETER_TYPES[parameter.get('type', 'string')],
+                                                     description=parameter.get('description', ''), used_by=[])
+            properties[parameter['name']]['used_by'].append(query_name)
+    if not properties:
+        return None
+    for schema in properties.values():
+        schema['description'] += f" (used by {', '.join(schema.pop('used_by'))})"
+    return {
+        "type": "object",
+        "description": "Values for the parameters of the chosen verified query; omitted ones take their default",
+        "properties": properties,
+    }
+
+
+class PreparedQueries:
+    """
+    Runs parameterised verified queries as DuckDB prepared statements with bound parameters.
+
+    A verified query can declare `parameters` (each with a name, type, description and optional
+    default) and refer to them as $name in its SQL. The values are validated against their declared
+    types and passed to DuckDB separately from the SQL, so they are never parsed as SQL. Each worker
+    thread has its own cursor.
+
+    DuckDB's EXECUTE statement can't take bound parameters, only values spliced into its text, so the
+    SQL isn't PREPAREd once per cursor: the client prepares it on each call and binds the values.
+
+    Parameters:
+    columnar_cache (ColumnarCache): Resolves the CSV files referenced by the SQL to Parquet copies.
+    """
+
+    def __init__(self, columnar_cache):
+        self.columnar_cache = columnar_cache
+        self.conn = duckdb.connect(database=':memory:')
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def cursor(self):
+        """
+        Returns the calling thread's cursor. Cursors share the connection's data but run queries
+        independently, so a pool of threads is a pool of cursors.
+        """
+        if not hasattr(self._local, 'cursor'):
+            with self._lock:
+                self._local.cursor = self.conn.cursor()
+        return self._local.cursor
+
+    def execute(self, query_name, verified_query, values=None):
+        """
+        Executes a parameterised verified query.
+
+        Parameters:
+        query_name (str): The name of the verified query.
+        verified_query (dict): Its parsed YAML, with `sql` and `parameters`.
+        values (dict): Parameter values by name; missing ones take their default.
+
+        Returns:
+        pandas.DataFrame: The query result.
+
+        Raises:
+        ValueError: If a parameter without a default is missing, or a value isn't a single finite value of its type.
+        """
+        values = values or {}
+        if not isinstance(values, dict):
+            raise ValueError(f"parameters must be an object mapping names to values, got {values!r}")
+        arguments = {}
+        for parameter in verified_query.get('parameters') or []:
+            value = values.get(parameter['name'], parameter.get('default'))
+            if value is None:
+                raise ValueError(f"the {query_name} query needs a value for parameter {parameter['name']}")
+            arguments[parameter['name']] = _to_value(parameter, value)
+
+        query = self.columnar_cache.rewrite_table_references(verified_query['sql']).strip().rstrip(';')
+        return self.cursor().execute(query, arguments).fetchdf()
@@ -0,0 +1,189 @@
+import copy
+import math
+import re
+from collections import Counter, defaultdict
+
+import numpy as np
+
+STOP_WORDS = frozenset("""
+a about all an and any are as at be by did do does for from get give has have how i in is it list me
+my of on or show tell that the their them there they this to us was we were what when where which who
+whose with you your
+""".split())
+
+
+def _stem(word):
+    """A crude singular form, so 'purchases' in a question matches 'purchase' in a description."""
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith('es') and len(word) > 4 and word[-3] in 'sxz':
+        return word[:-2]
+    if word.endswith('s') and not word.endswith('ss') and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    """Splits text into lower-cased, crudely stemmed words, dropping stop words."""
+    return [_stem(word) for word in re.findall(r'[a-z0-9]+', text.lower()) if word not in STOP_WORDS]
+
+
+def document_text(query_name, verified_query):
+    """The text a verified query is indexed by: its name, with hyphens as spaces, and its description."""
+    return f"{query_name.replace('-', ' ')} {verified_query.get('description', '')}"
+
+
+class QueryIndex:
+    """
+    A BM25 index over the verified queries, so only the few queries relevant to a question have to
+    be put into the prompt and the tool schema.
+
+    Each term maps to a posting list of the queries containing it and how often, stored as numpy
+    arrays. A search only touches the posting lists of the question's terms, turns their counts into
+    BM25 weights and sums them with one bincount, so it stays well under a millisecond even with 100k
+    verified queries. Because the weights are computed at search time, updated() can add, replace or
+    drop a few queries by rewriting only the posting lists of their terms.
+
+    Parameters:
+    verified_queries_dict (dict): Query names mapped to the parsed YAML of each verified query.
+    k1 (float): BM25 term-frequency saturation.
+    b (float): BM25 length normalization.
+    term_counts (dict): Optionally, query names mapped to the count_terms() of each query, so queries
+        that were already tokenized don't have to be tokenized again.
+    """
+
+    def __init__(self, verified_queries_dict, k1=1.2, b=0.75, term_counts=None):
+        term_counts = term_counts or {}
+        self.k1 = k1
+        self.b = b
+        self.names = sorted(verified_queries_dict)
+        self._doc_ids = {query_name: doc_id for doc_id, query_name in enumerate(self.names)}
+        self._term_counts = {}
+        self._lengths = np.zeros(len(self.names))
+        postings = defaultdict(list)
+        for doc_id, query_name in enumerate(self.names):
+            if query_name in term_counts:
+                query_term_counts = term_counts[query_name]
+            else:
+                query_term_counts = self.count_terms(query_name, verified_queries_dict[query_name])
+            self._term_counts[query_name] = query_term_counts
+            self._lengths[doc_id] = sum(query_term_counts.values())
+            for term, count in query_term_counts.items():
+                postings[term].append((doc_id, count))
+
+        self._n_docs = len(self.names)
+        self._total_length = float(self._lengths.sum())
+        self._postings = {
+            term: (np.array([doc_id for doc_id, _ in entries], dtype=np.int64),
+                   np.array([count for _, count in entries], dtype=np.float64))
+            for term, entries in postings.items()
+        }
+
+    @staticmethod
+    def count_terms(query_name, verified_query):
+        """Returns how often each term occurs in the indexed text of a verified query."""
+        return Counter(tokenize(document_text(query_name, verified_query)))
+
+    def __len__(self):
+        return self._n_docs
+
+    def updated(self, changed, removed=()):
+        """
+        Returns a copy of the index with some queries added, replaced or dropped.
+
+        Only the posting lists of the terms those queries contain are rewritten; every other posting
+        list is shared with this index, which is left untouched so searches already running on it keep
+        a consistent view. Dropped queries leave an empty slot behind, and the index is rebuilt from
+        its term counts once the empty slots outnumber the queries.
+
+        Parameters:
+        changed (dict): Names of added or changed queries mapped to their count_terms().
+        removed (iterable): Names of deleted queries.
+
+        Returns:
+        QueryIndex: The updated index.
+        """
+        index = copy.copy(self)
+        index.names = list(self.names)
+        index._doc_ids = dict(self._doc_ids)
+        index._term_counts = dict(self._term_counts)
+        index._postings = dict(self._postings)
+
+        stale = defaultdict(list)
+        lengths = self._lengths.copy()
+        for query_name in set(removed) | set(changed):
+            doc_id = index._doc_ids.get(query_name)
+            if doc_id is None:
+                continue
+            for term in index._term_counts.pop(query_name):
+                stale[term].append(doc_id)
+            index._total_length -= lengths[doc_id]
+            lengths[doc_id] = 0
+            if query_name not in changed:
+                index.names[doc_id] = None
+                del index._doc_ids[query_name]
+                index._n_docs -= 1
+
+        added = [query_name for query_name in sorted(changed) if query_name not in index._doc_ids]
+        for query_name in added:
+            index._doc_ids[query_name] = len(index.names)
+            index.names.append(query_name)
+        index._n_docs += len(added)
+        index._lengths = np.concatenate([lengths, np.zeros(len(added))])
+
+        fresh = defaultdict(list)
+        for query_name, query_term_counts in changed.items():
+            doc_id = index._doc_ids[query_name]
+            index._term_counts[query_name] = query_term_counts
+            index._lengths[doc_id] = sum(query_term_counts.values())
+            index._total_length += index._lengths[doc_id]
+            for term, count in query_term_counts.items():
+                fresh[term].append((doc_id, count))
+
+        for term in set(stale) | set(fresh):
+            doc_ids, counts = index._postings.get(term, (np.empty(0, dtype=np.int64), np.empty(0)))
+            if term in stale:
+                keep = ~np.isin(doc_ids, stale[term])
+                doc_ids, counts = doc_ids[keep], counts[keep]
+            if term in fresh:
+                doc_ids = np.concatenate([doc_ids, [doc_id for doc_id, _ in fresh[term]]]).astype(np.int64)
+                counts = np.concatenate([counts, [count for _, count in fresh[term]]]).astype(np.float64)
+            if len(doc_ids):
+                index._postings[term] = (doc_ids, counts)
+            else:
+                index._postings.pop(term, None)
+
+        if len(index.names) - index._n_docs > max(index._n_docs, 64):
+            return QueryIndex(index._term_counts, index.k1, index.b, term_counts=index._term_counts)
+        return index
+
+    def search(self, question, k=5):
+        """
+        Returns the verified queries that best match a question.
+
+        Parameters:
+        question (str): The user's question.
+        k (int): The maximum number of queries to return.
+
+        Returns:
+        list: (query_name, score) pairs, best first. Queries sharing no terms with the question are never returned.
+        """
+        terms = [term for term in set(tokenize(question)) if term in self._postings]
+        if not terms:
+            return []
+        average_length = self._total_length / self._n_docs
+        doc_ids = np.concatenate([self._postings[term][0] for term in terms])
+        weights = []
+        for term in terms:
+            term_doc_ids, counts = self._postings[term]
+            idf = math.log(1 + (self._n_docs - len(term_doc_ids) + 0.5) / (len(term_doc_ids) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[term_doc_ids] / max(average_length, 1.0))
+            weights.append(idf * counts * (self.k1 + 1) / (counts + norm))
+
+        scores = np.bincount(doc_ids, weights=np.concatenate(weights), minlength=len(self.names))
+        # Every BM25 weight is positive, so the queries with a non-zero score are exactly those matched
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(self.names[doc_id], float(scores[doc_id])) for doc_id in candidates]
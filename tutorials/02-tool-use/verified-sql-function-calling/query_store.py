@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+from collections import namedtuple
+
+import yaml
+
+from query_index import QueryIndex
+
+# An immutable view of the verified queries and the index over them, replaced as a whole on every reload
+QuerySnapshot = namedtuple('QuerySnapshot', ['queries', 'index', 'version'])
+
+
+class VerifiedQueryStore:
+    """
+    Loads the verified queries from a directory of YAML files and keeps them up to date while the app runs.
+
+    A background thread polls the directory. Only files whose mtime or size changed are parsed again,
+    and only the queries of changed or deleted files are updated in the search index, so a reload
+    costs in proportion to what changed. The queries and the index are then published together as a
+    new QuerySnapshot with a single assignment, so a request that took a snapshot keeps a consistent
+    view of both while the next one is built.
+
+    Noticing a change still means listing the directory and calling stat() on every YAML file on each
+    poll. That is a few milliseconds per 10k files; raise poll_seconds for directories much larger than that.
+
+    A file that fails to parse keeps its previous version until it is fixed.
+
+    Parameters:
+    directory_path (str): The directory containing the verified query YAML files.
+    poll_seconds (float): How often to check the directory for changes.
+    """
+
+    def __init__(self, directory_path, poll_seconds=2.0):
+        self.directory_path = directory_path
+        self.poll_seconds = poll_seconds
+        self._files = {}
+        self._lock = threading.Lock()
+        self._snapshot = QuerySnapshot({}, QueryIndex({}), 0)
+        self.reload()
+
+    def snapshot(self):
+        """Returns the current verified queries and search index."""
+        return self._snapshot
+
+    def reload(self):
+        """
+        Re-parses the YAML files that were added or changed since the last reload and publishes a new
+        snapshot if anything changed.
+
+        Returns:
+        bool: Whether the verified queries changed.
+        """
+        with self._lock:
+            seen = set()
+            changed = {}
+            term_counts = {}
+            removed = set()
+            for entry in os.scandir(self.directory_path):
+                if not entry.name.endswith('.yaml') or not entry.is_file():
+                    continue
+                seen.add(entry.path)
+                stat = entry.stat()
+                signature = (stat.st_mtime_ns, stat.st_size)
+                cached = self._files.get(entry.path)
+                if cached is not None and cached['signature'] == signature:
+                    continue
+
+                query_name = os.path.splitext(entry.name)[0]
+                try:
+                    with open(entry.path, 'r') as stream:
+                        verified_query = yaml.safe_load(stream)
+                    if not isinstance(verified_query, dict) or 'sql' not in verified_query:
+                        raise ValueError("expected a mapping with a description and sql")
+                except (OSError, yaml.YAMLError, ValueError) as exc:
+                    print(f"Skipping {entry.path}: {exc}")
+                    if cached is not None:
+                        cached['signature'] = signature
+                    else:
+                        self._files[entry.path] = {'signature': signature, 'name': None}
+                    continue
+
+                self._files[entry.path] = {'signature': signature, 'name': query_name}
+                changed[query_name] = verified_query
+                term_counts[query_name] = QueryIndex.count_terms(query_name, verified_query)
+
+            for path in set(self._files) - seen:
+                if self._files[path]['name'] is not None:
+                    removed.add(self._files[path]['name'])
+                del self._files[path]
+
+            if not changed and not removed:
+                return False
+            snapshot = self._snapshot
+            queries = {name: query for name, query in snapshot.queries.items() if name not in removed}
+            queries.update(changed)
+            index = snapshot.index.updated(term_counts, removed)
+            self._snapshot = QuerySnapshot(queries, index, snapshot.version + 1)
+            return True
+
+    def start(self):
+        """Starts polling the directory in a background thread."""
+        def run():
+            while True:
+                time.sleep(self.poll_seconds)
+                try:
+                    if self.reload():
+                        print(f"\nReloaded verified queries: {len(self._snapshot.queries)} available")
+                except OSError as exc:
+                    print(f"\nCould not reload verified queries: {exc}")
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
@@ -1,6 +1,6 @@
 import streamlit as st
 from typing import Generator
-from groq import Groq
+from client_factory import connection_stats, get_client
 
 st.set_page_config(page_icon="💬", layout="wide", page_title="Groq Goes Brrrrrrrr...")
 
@@ -17,9 +17,9 @@ icon("🏎️")
 
 st.subheader("Groq Chat Streamlit App", divider="rainbow", anchor=False)
 
-client = Groq(
-    api_key=st.secrets["GROQ_API_KEY"],
-)
+# Streamlit reruns this script on every interaction. get_client() returns the same pooled
+# client across reruns, so requests reuse warm connections instead of reconnecting each time
+client = get_client(api_key=st.secrets["GROQ_API_KEY"])
 
 # Initialize chat history and selected model
 if "messages" not in st.session_state:
@@ -128,3 +128,6 @@ if prompt := st.chat_input("Enter your prompt here..."):
         st.session_state.messages.append(
             {"role": "assistant", "content": combined_response}
         )
+
+with st.sidebar.expander("Connection stats"):
+    st.json(connection_stats())
@@ -0,0 +1,109 @@
+import os
+import threading
+import weakref
+
+import httpx
+from groq import AsyncGroq, DefaultAsyncHttpxClient, DefaultHttpxClient, Groq
+
+# Keep idle connections open long enough to be reused between chat turns
+POOL_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=120)
+TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+
+_lock = threading.Lock()
+_client = None
+_async_client = None
+# Holds the network streams seen so far without keeping closed connections alive
+_seen_connections = weakref.WeakSet()
+_stats = {"requests": 0, "new_connections": 0, "reused_connections": 0}
+
+
+def _record_response(response):
+    # httpcore exposes the underlying socket stream; seeing the same one again means the connection was reused.
+    # Streams are tracked by reference rather than id(), since a closed stream's id can be reused by a new one
+    network_stream = response.extensions.get("network_stream")
+    with _lock:
+        _stats["requests"] += 1
+        if network_stream is None:
+            return
+        if network_stream in _seen_connections:
+            _stats["reused_connections"] += 1
+        else:
+            _seen_connections.add(network_stream)
+            _stats["new_connections"] += 1
+
+
+async def _record_response_async(response):
+    _record_response(response)
+
+
+def get_client(api_key=None, warm_up=True):
+    """
+    Returns the process-wide Groq client, creating it on first use.
+
+    All callers share one pooled HTTP client, so only the first request pays for DNS, TLS and
+    connection setup. With warm_up=True, that first request is made in the background right away.
+
+    Parameters:
+    api_key (str): The Groq API key. Defaults to the GROQ_API_KEY environment variable.
+    warm_up (bool): Open a connection in the background when the client is created.
+
+    Returns:
+    Groq: The shared client.
+    """
+    global _client
+    with _lock:
+        if _client is None:
+            http_client = DefaultHttpxClient(limits=POOL_LIMITS, timeout=TIMEOUT,
+                                             event_hooks={"response": [_record_response]})
+            _client = Groq(api_key=api_key or os.getenv("GROQ_API_KEY"), http_client=http_client)
+            if warm_up:
+                threading.Thread(target=warm_up_client, args=(_client,), daemon=True).start()
+        return _client
+
+
+def get_async_client(api_key=None):
+    """
+    Returns the process-wide AsyncGroq client, creating it on first use.
+    Await warm_up_async_client(client) at startup to open a connection before the first request.
+
+    Parameters:
+    api_key (str): The Groq API key. Defaults to the GROQ_API_KEY environment variable.
+
+    Returns:
+    AsyncGroq: The shared client.
+    """
+    global _async_client
+    with _lock:
+        if _async_client is None:
+            http_client = DefaultAsyncHttpxClient(limits=POOL_LIMITS, timeout=TIMEOUT,
+                                                  event_hooks={"response": [_record_response_async]})
+            _async_client = AsyncGroq(api_key=api_key or os.getenv("GROQ_API_KEY"), http_client=http_client)
+        return _async_client
+
+
+def warm_up_client(client):
+    """Opens a pooled connection with a cheap request so the first chat request can reuse it."""
+    try:
+        client.models.list()
+    except Exception:
+        # Warm-up is best effort; a real request will surface any configuration problem
+        pass
+
+
+async def warm_up_async_client(client):
+    """The AsyncGroq equivalent of warm_up_client."""
+    try:
+        await client.models.list()
+    except Exception:
+        pass
+
+
+def connection_stats():
+    """
+    Returns how many requests the shared clients have made and how many of them
+    opened a new connection versus reused a pooled one.
+    """
+    with _lock:
+        stats = dict(_stats)
+    stats["reuse_ratio"] = stats["reused_connections"] / stats["requests"] if stats["requests"] else 0.0
+    return stats
@@ -0,0 +1,113 @@
+import glob
+import hashlib
+import json
+import os
+import re
+import threading
+
+import duckdb
+
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+class ColumnarCache:
+    """
+    Converts each CSV file in `data_dir` to Parquet the first time it is used and keeps the
+    Parquet copy in `cache_dir`, so queries scan a columnar file instead of re-parsing the CSV.
+
+    A copy is rebuilt only when its source changes. The source's mtime and size are checked
+    first; if they differ, its SHA-256 is compared, so touching a file without changing it
+    doesn't trigger a rebuild.
+
+    Parameters:
+    data_dir (str): The directory containing the CSV files.
+    cache_dir (str): Where to keep the Parquet copies. Defaults to data_dir/.columnar_cache.
+    """
+
+    def __init__(self, data_dir='data', cache_dir=None):
+        self.data_dir = data_dir
+        self.cache_dir = cache_dir or os.path.join(data_dir, '.columnar_cache')
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.manifest_path = os.path.join(self.cache_dir, 'manifest.json')
+        self._lock = threading.Lock()
+        try:
+            with open(self.manifest_path, 'r') as f:
+                self.manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.manifest = {}
+
+    def sources(self):
+        """Returns a dictionary of table name to CSV path for every CSV file in the data directory."""
+        return {os.path.splitext(os.path.basename(path))[0]: path
+                for path in sorted(glob.glob(os.path.join(self.data_dir, '*.csv')))}
+
+    def is_stale(self, table_name, csv_path):
+        """Checks, without rebuilding anything, whether the source's mtime or size has changed."""
+        entry = self.manifest.get(table_name)
+        if entry is None or not os.path.exists(os.path.join(self.cache_dir, entry['parquet'])):
+            return True
+        stat = os.stat(csv_path)
+        return entry['mtime_ns'] != stat.st_mtime_ns or entry['size'] != stat.st_size
+
+    def get_parquet_path(self, table_name, csv_path):
+        """
+        Returns the path to the Parquet copy of a CSV file, converting it first if it is missing or stale.
+
+        Parameters:
+        table_name (str): The name the CSV file is queried by, e.g. employees for employees.csv.
+        csv_path (str): The path to the CSV file.
+
+        Returns:
+        str: The path to the Parquet file.
+        """
+        with self._lock:
+            parquet_path = os.path.join(self.cache_dir, f'{table_name}.parquet')
+            if not self.is_stale(table_name, csv_path):
+                return parquet_path
+
+            stat = os.stat(csv_path)
+            sha256 = file_sha256(csv_path)
+            entry = self.manifest.get(table_name)
+            if entry is None or entry['sha256'] != sha256 or not os.path.exists(parquet_path):
+                tmp_path = parquet_path + '.tmp'
+                escaped_csv_path = csv_path.replace("'", "''")
+                escaped_tmp_path = tmp_path.replace("'", "''")
+                conn = duckdb.connect(database=':memory:')
+                try:
+                    conn.execute(f"COPY (SELECT * FROM read_csv_auto('{escaped_csv_path}')) "
+                                 f"TO '{escaped_tmp_path}' (FORMAT PARQUET)")
+                finally:
+                    conn.close()
+                os.replace(tmp_path, parquet_path)
+
+            self.manifest[table_name] = {
+                'parquet': os.path.basename(parquet_path),
+                'mtime_ns': stat.st_mtime_ns,
+                'size': stat.st_size,
+                'sha256': sha256,
+            }
+            with open(self.manifest_path, 'w') as f:
+                json.dump(self.manifest, f, indent=2)
+            return parquet_path
+
+    def rewrite_table_references(self, query):
+        """
+        Rewrites references to CSV files in the data directory, such as purchases.csv or 'purchases.csv',
+        to scans of their Parquet copies, converting the CSVs first if needed.
+        """
+        sources = self.sources()
+
+        def replace(match):
+            table_name = match.group(2)
+            if table_name not in sources:
+                return match.group(0)
+            parquet_path = self.get_parquet_path(table_name, sources[table_name]).replace("'", "''")
+            return f"read_parquet('{parquet_path}')"
+
+        return re.sub(r'''(['"]?)\b([A-Za-z_][A-Za-z0-9_]*)\.csv\1''', replace, query)